@@ -1,49 +1,29 @@
 import asyncio
 import os
-import csv
-import requests
 import streamlit as st
-from openpyxl import Workbook
-from playwright.async_api import async_playwright
 import tempfile
-from bs4 import BeautifulSoup
-import subprocess
-import zipfile
+import shutil
 import datetime
-import random
+import time
 import pandas as pd
-from contextlib import asynccontextmanager
-
-ua_list = []
-
-with open('ua_list.txt', 'r') as f:
-    ua_list = f.readlines()
-
-ua_list = [ua.strip() for ua in ua_list]
-
-def ensure_playwright_browser():
-    """確保 Playwright 的 Chromium 瀏覽器已安裝"""
-    browser_path = os.path.expanduser("~/.cache/ms-playwright/chromium-1097/chrome-linux/chrome")
-    if not os.path.exists(browser_path):
-        print("安裝 Playwright 瀏覽器...")
-        try:
-            subprocess.run(["playwright", "install", "chromium"], check=True)
-            try:
-                subprocess.run(["playwright", "install-deps", "chromium"], check=False)
-            except:
-                pass
-            print("Playwright 瀏覽器安裝成功")
-        except Exception as e:
-            print(f"安裝 Playwright 瀏覽器失敗: {e}")
-            try:
-                subprocess.run(["python", "-m", "playwright", "install", "chromium"], check=True)
-                try:
-                    subprocess.run(["python", "-m", "playwright", "install-deps", "chromium"], check=False)
-                except:
-                    pass
-                print("使用 python -m 安裝 Playwright 瀏覽器成功")
-            except Exception as e:
-                print(f"使用 python -m 安裝 Playwright 瀏覽器失敗: {e}")
+from browser_service import BrowserBusyError, ensure_playwright_browser
+from fulltext_index import QuerySyntaxError, get_fulltext_index
+from judgment_cache import get_judgment_cache
+from metrics import STAGES, get_metrics
+from request_scheduler import get_scheduler
+from judgment_core import (
+    DETAIL_CONCURRENCY,
+    LazyBrowserContext,
+    ensure_details,
+    fetch_judgments,
+    fetch_judgments_partitioned,
+    full_judgment_url,
+    pending_details,
+)
+from archive import StreamingZipWriter
+from download_jobs import DownloadJob, cleanup_jobs, run_download_job
+from exports import get_export
+from result_store import compact_judgments, with_texts
 
 ensure_playwright_browser()
 
@@ -57,426 +37,10 @@ st.set_page_config(
 DOWNLOAD_FOLDER = "./downloads"
 os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
-@asynccontextmanager
-async def get_browser_context():
-    """瀏覽器上下文管理器"""
-    browser = None
-    context = None
-    try:
-        browser = await async_playwright().start()
-        browser = await browser.chromium.launch(
-            headless=True,
-            args=[
-                '--no-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-gpu',
-                '--disable-software-rasterizer',
-                '--disable-accelerated-2d-canvas',
-                '--no-zygote',
-                '--single-process'
-            ]
-        )
-        ua = random.choice(ua_list)
-        context = await browser.new_context(
-            viewport={"width": 1280, "height": 800},
-            user_agent=ua
-        )
-        yield context
-    finally:
-        if context:
-            await context.close()
-        if browser:
-            await browser.close()
-
-async def get_judgment_details(context, url):
-    """獲取裁判詳細資訊（字號、日期、案由和裁判全文）"""
-    page = None
-    try:
-        page = await context.new_page()
-        base_url = "https://judgment.judicial.gov.tw/FJUD/"
-        full_url = url if url.startswith("http") else base_url + url
-        
-        await page.goto(full_url, timeout=30000)
-        await page.wait_for_selector(".row", timeout=20000)
-        
-        rows = await page.query_selector_all(".row")
-        case_number = "未找到裁判字號"
-        case_date = "未找到裁判日期"
-        case_reason = "未找到案由"
-        full_judgment_text = "未找到裁判全文"
-        
-        # Extract case details
-        for row in rows:
-            text = await row.inner_text()
-            if "裁判字號：" in text:
-                try:
-                    cols = await row.query_selector_all(".col-td")
-                    if cols and len(cols) > 0:
-                        case_number = await cols[0].inner_text()
-                        case_number = case_number.strip()
-                except:
-                    continue
-            elif "裁判日期：" in text:
-                try:
-                    cols = await row.query_selector_all(".col-td")
-                    if cols and len(cols) > 0:
-                        case_date = await cols[0].inner_text()
-                        case_date = case_date.strip()
-                except:
-                    continue
-            elif "裁判案由：" in text:
-                try:
-                    cols = await row.query_selector_all(".col-td")
-                    if cols and len(cols) > 0:
-                        case_reason = await cols[0].inner_text()
-                        case_reason = case_reason.strip()
-                except:
-                    continue
-        
-        # Extract the full judgment text (from a different section)
-        judgment_text_element = await page.query_selector(".htmlcontent")
-        if judgment_text_element:
-            full_judgment_text = await judgment_text_element.inner_text()
-            full_judgment_text = full_judgment_text.strip()
-
-        return {
-            "case_number": case_number,
-            "case_date": case_date,
-            "case_reason": case_reason,
-            "case_text": full_judgment_text
-        }
-    except Exception as e:
-        print(f"獲取裁判詳細資訊失敗: {e}")
-        return {
-            "case_number": "獲取失敗",
-            "case_date": "獲取失敗",
-            "case_reason": "獲取失敗",
-            "case_text": "獲取失敗"
-        }
-    finally:
-        if page:
-            await page.close()
-
-async def fetch_judgments(context, keyword, max_pages=25):
-    """非同步獲取裁判書資料"""
-    progress_placeholder = st.progress(0)
-    status_placeholder = st.empty()
-    status_placeholder.text("正在準備查詢...")
-    
-    try:
-        page = await context.new_page()
-        
-        status_placeholder.text("正在連接法院判決網站...")
-        await page.goto("https://judgment.judicial.gov.tw/FJUD/default.aspx", timeout=60000)
-        
-        status_placeholder.text(f"輸入搜尋關鍵字: {keyword}")
-        await page.fill("#txtKW", keyword)
-        
-        status_placeholder.text("送出查詢，請稍候...")
-        await page.click("#btnSimpleQry")
-        
-        await asyncio.sleep(5)
-        
-        frame = None
-        iframe = await page.query_selector("#iframe-data")
-        if iframe:
-            frame = page.frame(name="iframe-data") or page.frame(id="iframe-data")
-        
-        if not frame:
-            for f in page.frames:
-                if "FJUD/data.aspx" in f.url:
-                    frame = f
-                    break
-        
-        if not frame:
-            frame_locator = page.frame_locator("iframe").first
-            if await frame_locator.count() > 0:
-                frame = await frame_locator.frame()
-        
-        if not frame:
-            status_placeholder.text("尋找判決清單框架...")
-            judgment_links = await page.query_selector_all("a[id*='hlTitle']")
-            if len(judgment_links) > 0:
-                judgment_urls = []
-                for link in judgment_links:
-                    href = await link.get_attribute("href")
-                    text = await link.inner_text()
-                    details = await get_judgment_details(context, href)
-                    judgment_urls.append({
-                        "title": text,
-                        "url": href,
-                        "case_number": details["case_number"],
-                        "case_date": details["case_date"],
-                        "case_reason": details["case_reason"],
-                        "case_text": details["case_text"]
-                    })
-                progress_placeholder.progress(1.0)
-                status_placeholder.text(f"找到 {len(judgment_urls)} 筆判決")
-                return judgment_urls, 1
-            else:
-                progress_placeholder.progress(1.0)
-                status_placeholder.text("未找到任何判決")
-                return [], 0
-        
-        status_placeholder.text("等待判決清單載入...")
-        await frame.wait_for_selector("a[id*='hlTitle']", timeout=20000)
-        
-        all_judgments = []
-        current_page = 1
-        
-        while current_page <= max_pages:
-            elements = await frame.query_selector_all("a[id*='hlTitle']")
-            page_judgments = []
-            
-            for el in elements:
-                url = await el.get_attribute("href")
-                text = await el.inner_text()
-                details = await get_judgment_details(context, url)
-                page_judgments.append({
-                    "title": text,
-                    "url": url,
-                    "case_number": details["case_number"],
-                    "case_date": details["case_date"],
-                    "case_reason": details["case_reason"],
-                    "case_text": details["case_text"]
-                })
-            
-            all_judgments.extend(page_judgments)
-            
-            progress_percentage = current_page / max_pages
-            progress_placeholder.progress(progress_percentage)
-            status_placeholder.text(f"進度: {current_page}/{max_pages} 頁 | 當前頁: {len(page_judgments)}筆 | 總計: {len(all_judgments)}筆")
-            
-            if current_page < max_pages:
-                try:
-                    next_link = await frame.query_selector("a#hlNext")
-                    if next_link:
-                        current_titles = await frame.eval_on_selector_all("a[id*='hlTitle']", "els => els.map(el => el.textContent)")
-                        
-                        await next_link.click()
-                        status_placeholder.text(f"正在切換到第 {current_page + 1} 頁...")
-                        
-                        await asyncio.sleep(3)
-                        await frame.wait_for_selector("a[id*='hlTitle']", timeout=20000)
-                        
-                        max_retries = 3
-                        for retry in range(max_retries):
-                            new_titles = await frame.eval_on_selector_all("a[id*='hlTitle']", "els => els.map(el => el.textContent)")
-                            if new_titles != current_titles:
-                                break
-                            
-                            if retry < max_retries - 1:
-                                status_placeholder.text(f"等待頁面載入... (嘗試 {retry + 1}/{max_retries})")
-                                await asyncio.sleep(2)
-                            else:
-                                status_placeholder.warning("頁面可能未正確變化，繼續處理...")
-                    else:
-                        status_placeholder.text("已到最後一頁")
-                        break
-                except Exception as e:
-                    status_placeholder.text(f"切換頁面時發生錯誤: {e}")
-                    try:
-                        for f in page.frames:
-                            if "FJUD/data.aspx" in f.url:
-                                frame = f
-                                break
-                        await asyncio.sleep(3)
-                        continue
-                    except:
-                        break
-            
-            current_page += 1
-        
-        total_pages = await get_total_pages(frame)
-        
-        progress_placeholder.progress(1.0)
-        status_placeholder.text(f"完成查詢！")
-        
-        return all_judgments, total_pages
-        
-    except Exception as e:
-        progress_placeholder.progress(1.0)
-        status_placeholder.text(f"查詢過程中發生錯誤: {e}")
-        return [], 0
-    finally:
-        if page:
-            await page.close()
-
-async def get_total_pages(frame):
-    """獲取總頁數"""
-    try:
-        next_link = await frame.query_selector("a#hlNext")
-        if not next_link:
-            return 1
-        
-        try:
-            page_info = await frame.inner_text("#divPager", timeout=5000)
-            if "共" in page_info and "頁" in page_info:
-                parts = page_info.split("共")[1].split("頁")[0].strip()
-                return int(parts)
-        except:
-            pass
-        
-        try:
-            select_html = await frame.inner_html("#ddlPage", timeout=5000)
-            soup = BeautifulSoup(select_html, 'html.parser')
-            select = soup.find('select', {'id': 'ddlPage'})
-            
-            if select:
-                options = select.find_all('option')
-                return len(options)
-        except:
-            pass
-        
-        return 2
-        
-    except Exception as e:
-        return 1
-
-async def batch_download_pdfs(context, judgment_batch, download_folder, progress_bar=None, status_text=None):
-    """批量下載一批判決書PDF"""
-    downloaded_files = []
-    errors = []
-    
-    for i, judgment in enumerate(judgment_batch):
-        name = judgment["case_number"]
-        url = judgment["url"]
-        
-        if status_text:
-            status_text.text(f"正在下載第 {i+1}/{len(judgment_batch)} 個: {name}")
-        if progress_bar:
-            progress_bar.progress((i+1)/len(judgment_batch))
-        
-        file_path, error = await download_judgment_pdf(context, url, download_folder)
-        if file_path:
-            downloaded_files.append(file_path)
-        else:
-            errors.append(f"{name}: {error}")
-    
-    return downloaded_files, errors
-
-async def download_judgment_pdf(context, url, download_folder):
-    """下載單個裁判書PDF"""
-    page = None
-    try:
-        page = await context.new_page()
-        base_url = "https://judgment.judicial.gov.tw/FJUD/"
-        full_url = url if url.startswith("http") else base_url + url
-        
-        await page.goto(full_url, timeout=30000)
-        await page.wait_for_selector("#jud", timeout=30000)
-        
-        # 獲取裁判字號和案由
-        rows = await page.query_selector_all("#jud .row")
-        case_number = "unknown_case"
-        case_reason = "unknown_reason"
-        
-        for row in rows:
-            text = await row.inner_text()
-            if "裁判字號：" in text:
-                try:
-                    cols = await row.query_selector_all(".col-td")
-                    if cols and len(cols) > 0:
-                        case_number = await cols[0].inner_text()
-                        case_number = case_number.strip()
-                except:
-                    continue
-            elif "裁判案由：" in text:
-                try:
-                    cols = await row.query_selector_all(".col-td")
-                    if cols and len(cols) > 0:
-                        case_reason = await cols[0].inner_text()
-                        case_reason = case_reason.strip()
-                except:
-                    continue
-        
-        def clean_filename(text):
-            keep_chars = (' ', '_', '-', '，', '。', '、', '：', '；', '？', '！', 
-                         '「', '」', '『', '』', '（', '）', '【', '】', '《', '》')
-            return "".join(c for c in text if c.isalnum() or c in keep_chars).strip()
-        
-        case_number_clean = clean_filename(case_number)
-        case_reason_clean = clean_filename(case_reason)
-        
-        safe_name = f"{case_number_clean}_{case_reason_clean}.pdf"
-        
-        if len(safe_name) > 200:
-            safe_name = f"{case_number_clean[:150]}_{case_reason_clean[:50]}.pdf"
-        
-        pdf_link = await page.query_selector("#hlExportPDF")
-        if not pdf_link:
-            return None, "找不到PDF下載連結"
-            
-        pdf_url = await pdf_link.get_attribute("href")
-        if pdf_url.startswith("/"):
-            pdf_url = "https://judgment.judicial.gov.tw" + pdf_url
-        
-        headers = {
-            "User-Agent": random.choice(ua_list)
-        }
-        response = requests.get(pdf_url, headers=headers)
-        
-        if response.status_code == 200:
-            file_path = os.path.join(download_folder, safe_name)
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            return file_path, None
-        else:
-            return None, f"PDF下載失敗，狀態碼: {response.status_code}"
-            
-    except Exception as e:
-        return None, f"下載過程中發生錯誤: {e}"
-    finally:
-        if page:
-            await page.close()
-
-def create_excel(judgments):
-    """建立Excel檔案"""
-    wb = Workbook()
-    ws = wb.active
-    ws.append(["序號", "裁判字號", "裁判日期", "裁判案由", "判決網址", "裁判書全文"])
-    
-    for idx, judgment in enumerate(judgments, 1):
-        ws.append([
-            idx,
-            judgment["case_number"],
-            judgment["case_date"],
-            judgment["case_reason"],
-            "https://judgment.judicial.gov.tw/FJUD/" + judgment["url"],
-            judgment["case_text"]
-        ])
-    
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-    wb.save(temp_file.name)
-    temp_file.close()
-    
-    return temp_file.name
-
-def create_csv(judgments):
-    """建立CSV檔案"""
-    # 創建一個臨時檔案
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".csv", mode='w', newline='', encoding='utf-8-sig')
-    
-    # 定義 CSV 寫入器
-    writer = csv.writer(temp_file)
-    
-    # 寫入標題
-    writer.writerow(["序號", "裁判字號", "裁判日期", "裁判案由", "判決網址", "裁判書全文"])
-    
-    # 寫入每筆裁判資料
-    for idx, judgment in enumerate(judgments, 1):
-        writer.writerow([
-            idx,
-            judgment["case_number"],
-            judgment["case_date"],
-            judgment["case_reason"],
-            "https://judgment.judicial.gov.tw/FJUD/" + judgment["url"],
-            judgment["case_text"]
-        ])
-    
-    temp_file.close()
-    
-    return temp_file.name
+# 背景預先載入詳細資訊時每批的筆數
+PREFETCH_BATCH_SIZE = 20
+# 本機全文檢索最多顯示的筆數
+LOCAL_SEARCH_LIMIT = 1000
 
 with st.sidebar:
     st.markdown("""
@@ -498,10 +62,173 @@ with st.sidebar:
                 
     ## ⚠️ 其他注意事項
                 
-    - 若出現錯誤，請多按幾次「開始查詢」
+    - 連線逾時或伺服器忙碌時會自動降速並重試；若仍出現錯誤，請再按一次「開始查詢」
     - 由於司法院裁判書系統針對一個關鍵字最多僅顯示 500 筆資料，因此建議以精確關鍵字搜尋（如可以新增法院名稱、判決年份等）
     """)
 
+async def export_button(browser, fmt, label, keyword, mime, concurrency):
+    """查詢結果清單的匯出按鈕，按下後才產生檔案，相同結果集只產生一次"""
+    export_path = st.session_state.exports.get(fmt)
+    if not export_path or not os.path.exists(export_path):
+        if not st.button(f"產生查詢結果清單 ({label})", key=f"prepare_{fmt}"):
+            return
+        await load_pending_details(browser, st.session_state.judgments, concurrency)
+        with st.spinner(f"正在產生 {label} 檔案..."):
+            # 全文從磁碟暫存區分批讀回，不會一次全部載入記憶體；雜湊值在寫出時一併計算
+            export_path = get_export(with_texts(st.session_state.judgments), fmt)
+        st.session_state.exports[fmt] = export_path
+    
+    with open(export_path, "rb") as f:
+        st.download_button(
+            label=f"下載查詢結果清單 ({label})",
+            data=f,
+            file_name=f"{keyword}_裁判書查詢結果.{fmt}",
+            mime=mime,
+            key=f"download_{fmt}"
+        )
+
+async def load_pending_details(browser, judgments, concurrency):
+    """載入指定判決中尚未取得的詳細資訊，並讓匯出快取失效"""
+    pending = pending_details(judgments)
+    if not pending:
+        return
+    with st.spinner(f"正在載入 {len(pending)} 筆判決的詳細內容..."):
+        await ensure_details(await browser.get(), pending, concurrency)
+    compact_judgments(pending)
+    st.session_state.exports = {}
+    st.session_state.page_tables = {}
+
+async def prefetch_details(browser, judgments, concurrency):
+    """在背景分批預先載入其餘判決的詳細資訊
+
+    每批完成就寫回 session state；使用者操作觸發重新執行時會中斷於下一次
+    狀態更新，已載入的部分不會遺失。每批只短暫租用瀏覽器，且不排隊等待：
+    名額已滿時暫停預先載入，把瀏覽器讓給其他使用者的查詢。
+    """
+    # 查詢期間租用的上下文先歸還，批次之間其他工作階段才有機會取得
+    await browser.release()
+    pending = pending_details(judgments)
+    if not pending:
+        return
+    status = st.empty()
+    total = len(judgments)
+    for start in range(0, len(pending), PREFETCH_BATCH_SIZE):
+        status.caption(f"背景載入詳細內容中：{total - len(pending) + start}/{total} 筆")
+        batch = pending[start:start + PREFETCH_BATCH_SIZE]
+        try:
+            context = await browser.get(lease_timeout=0)
+        except BrowserBusyError:
+            status.caption(f"其他使用者正在查詢，暫停背景載入（已載入 {total - len(pending) + start}/{total} 筆，檢視時會再載入）")
+            return
+        try:
+            await ensure_details(context, batch, concurrency)
+        finally:
+            await browser.release()
+        compact_judgments(batch)
+        st.session_state.exports = {}
+        st.session_state.page_tables = {}
+    status.caption(f"已載入全部 {total} 筆判決的詳細內容")
+
+async def download_pdfs_as_zip(context, judgments, zip_prefix, button_label, concurrency, volume_mb=0):
+    """批量下載 PDF 並打包成 ZIP，提供下載按鈕
+
+    下載進度記錄在磁碟上的下載工作中，中斷後重新執行同一批下載會略過已完成的
+    檔案，只重試失敗與尚未下載的部分。
+    """
+    total = len(judgments)
+    
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    status_text.text(f"準備下載 {total} 筆判決文件...")
+    
+    cleanup_jobs()
+    job = DownloadJob(judgments, zip_prefix)
+    temp_dir = tempfile.mkdtemp()
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_writer = StreamingZipWriter(temp_dir, f"{zip_prefix}_{timestamp}", volume_mb * 1024 * 1024)
+    
+    try:
+        with st.spinner(f"正在下載 {total} 筆判決..."):
+            # 每筆下載寫入日誌後立即加入壓縮檔；工作資料夾中的檔案是續傳依據
+            # （且與 PDF 快取共用硬連結），因此不刪除原檔
+            downloaded_files, errors = await run_download_job(
+                context, job, concurrency,
+                on_status=status_text.text,
+                on_progress=progress_bar.progress,
+                on_file=lambda file_path, file_name: zip_writer.add_file(file_path, file_name, remove_source=False)
+            )
+        volumes = zip_writer.close()
+        
+        if downloaded_files:
+            for number, zip_path in enumerate(volumes, 1):
+                label = button_label.format(count=len(downloaded_files))
+                if len(volumes) > 1:
+                    label += f"（第 {number}/{len(volumes)} 卷）"
+                with open(zip_path, "rb") as f:
+                    st.download_button(
+                        label=label,
+                        data=f,
+                        file_name=os.path.basename(zip_path),
+                        mime="application/zip",
+                        key=f"zip_{zip_prefix}_{number}"
+                    )
+            
+            st.success(f"已成功下載 {len(downloaded_files)}/{total} 個裁判書")
+            
+            if errors:
+                st.warning("部分裁判書下載失敗，重新下載時只會重試這些項目:")
+                for error in errors:
+                    st.error(error)
+        else:
+            st.error("沒有任何裁判書下載成功")
+        
+        if job.complete:
+            job.remove()
+    finally:
+        job.release()
+        zip_writer.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def show_local_search():
+    """在本機全文索引中重新檢索已讀取過的判決，不需連線司法院網站"""
+    with st.expander("🔎 本機全文檢索（已讀取過的判決）"):
+        index = get_fulltext_index()
+        query = st.text_input(
+            "檢索字詞",
+            key="local_query",
+            help="與查詢關鍵字相同的語法：& 為且、+ 為或、- 為非，可用括號分組"
+        )
+        only_current = False
+        if st.session_state.get("judgments"):
+            only_current = st.checkbox("只篩選目前的查詢結果", value=True, key="local_only_current")
+        if not query:
+            st.caption(f"本機索引共 {index.count()} 筆判決")
+            return
+        
+        start = time.perf_counter()
+        urls = [judgment["url"] for judgment in st.session_state.judgments] if only_current else None
+        try:
+            results = index.search(query, urls=urls, limit=LOCAL_SEARCH_LIMIT)
+        except QuerySyntaxError as e:
+            st.error(str(e))
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        
+        message = f"找到 {len(results)} 筆（{elapsed:.0f} 毫秒）"
+        if len(results) == LOCAL_SEARCH_LIMIT:
+            message += f"，僅顯示前 {LOCAL_SEARCH_LIMIT} 筆"
+        st.caption(message)
+        if results:
+            st.dataframe(pd.DataFrame([
+                {
+                    "裁判字號": result["case_number"],
+                    "裁判日期": result["case_date"],
+                    "裁判案由": result["case_reason"],
+                    "判決網址": full_judgment_url(result["url"])
+                }
+                for result in results
+            ]), hide_index=True)
+
 async def main_async():
     """非同步主函數"""
     st.title("⚖️ 裁判書查詢與下載工具")
@@ -515,10 +242,10 @@ async def main_async():
         st.session_state.search_clicked = False
     if "judgments" not in st.session_state:
         st.session_state.judgments = []
-    if "csv_file" not in st.session_state:
-        st.session_state.csv_file = None
-    if "excel_file" not in st.session_state:
-        st.session_state.excel_file = None
+    if "exports" not in st.session_state:
+        st.session_state.exports = {}
+    if "page_tables" not in st.session_state:
+        st.session_state.page_tables = {}
     if "download_all" not in st.session_state:
         st.session_state.download_all = False
     if "batch_download" not in st.session_state:
@@ -532,6 +259,8 @@ async def main_async():
     if "current_display_page" not in st.session_state:
         st.session_state.current_display_page = 1
     
+    show_local_search()
+    
     keyword = st.text_input(
         "查詢關鍵字", 
         value="(法院+管轄)&公證處",
@@ -546,6 +275,40 @@ async def main_async():
         help="設定要查詢的頁數（每頁約20筆結果，最多25頁）"
     )
 
+    concurrency = st.number_input(
+        "同時處理數量",
+        min_value=1,
+        max_value=10,
+        value=DETAIL_CONCURRENCY,
+        help="查詢時同時讀取的判決詳細頁數量，以及下載時同時下載的 PDF 數量，數值越大越快，但也越耗費記憶體"
+    )
+
+    partitioned = st.checkbox(
+        "自動分割查詢（突破 500 筆上限）",
+        value=False,
+        help="依裁判日期自動切分成多個子查詢並行執行，合併後去除重複；啟用時不受查詢頁數限制"
+    )
+    if partitioned:
+        date_col1, date_col2 = st.columns(2)
+        with date_col1:
+            partition_start = st.date_input("裁判日期起", value=datetime.date(1991, 1, 1), min_value=datetime.date(1912, 1, 1))
+        with date_col2:
+            partition_end = st.date_input("裁判日期迄", value=datetime.date.today(), min_value=datetime.date(1912, 1, 1))
+
+    lazy_details = st.checkbox(
+        "先顯示清單，詳細內容隨需載入",
+        value=True,
+        help="查詢後立即顯示結果清單，目前頁面的詳細內容優先載入，其餘在背景陸續載入"
+    )
+
+    zip_volume_mb = st.number_input(
+        "ZIP 分卷大小上限（MB）",
+        min_value=0,
+        value=0,
+        step=50,
+        help="批量下載的壓縮檔超過此大小時自動分卷，0 表示不分卷"
+    )
+
     if "search_clicked" not in st.session_state:
         st.session_state.search_clicked = False
 
@@ -554,16 +317,42 @@ async def main_async():
         st.session_state.search_completed = False
         st.session_state.download_all = False
         st.session_state.judgments = []
-        st.session_state.excel_file = None
-        st.session_state.csv_file = None
+        st.session_state.exports = {}
+        st.session_state.page_tables = {}
     
-    async with get_browser_context() as context:
+    browser_notice = st.empty()
+
+    def show_browser_wait(message):
+        if message:
+            browser_notice.info(message)
+        else:
+            browser_notice.empty()
+
+    async with LazyBrowserContext(on_wait=show_browser_wait) as browser:
         if st.session_state.get("search_clicked", False):
             search_result_container = st.container()
             with search_result_container:
                 if not st.session_state.get("search_completed", False):
                     with st.spinner("正在查詢裁判書，請稍候..."):
-                        judgments, total_pages = await fetch_judgments(context, keyword, max_pages)
+                        wait_timings = []
+                        progress_bar = st.progress(0)
+                        status_placeholder = st.empty()
+                        if partitioned:
+                            judgments, total_pages = await fetch_judgments_partitioned(
+                                await browser.get(), keyword, partition_start, partition_end, concurrency,
+                                wait_timings=wait_timings, lazy=lazy_details,
+                                on_status=status_placeholder.text,
+                                on_progress=progress_bar.progress,
+                                on_warning=st.warning
+                            )
+                        else:
+                            judgments, total_pages = await fetch_judgments(
+                                await browser.get(), keyword, max_pages, concurrency,
+                                wait_timings=wait_timings, lazy=lazy_details,
+                                on_status=status_placeholder.text,
+                                on_progress=progress_bar.progress
+                            )
+                        st.session_state.wait_timings = wait_timings
                         st.session_state.total_pages = total_pages
                         st.session_state.current_display_page = 1  # 重置為第一頁
                         
@@ -572,16 +361,18 @@ async def main_async():
                             st.session_state.search_clicked = False
                             return
                         
-                        st.session_state.judgments = judgments
+                        # 全文移到磁碟暫存區，session state 只保留中繼資料
+                        st.session_state.judgments = compact_judgments(judgments)
                         st.session_state.search_completed = True
                 
                 result_count = len(st.session_state.judgments)
                 # st.success(f"找到 {result_count} 筆裁判書結果")
                 
-                excel_file = create_excel(st.session_state.judgments)
-                csv_file = create_csv(st.session_state.judgments)
-                st.session_state.excel_file = excel_file
-                st.session_state.csv_file = csv_file
+                if st.session_state.get("wait_timings"):
+                    with st.expander("頁面等待時間"):
+                        st.table(pd.DataFrame(
+                            [{"等待項目": label, "秒數": round(elapsed, 2)} for label, elapsed in st.session_state.wait_timings]
+                        ))
                 
                 results_container = st.container()
                 with results_container:
@@ -616,19 +407,26 @@ async def main_async():
                     st.info(f"顯示第 {start_idx+1}-{end_idx} 筆（共 {total_items} 筆）")
                     
                     current_page_judgments = st.session_state.judgments[start_idx:end_idx]
+                    # 優先載入目前顯示的這一頁
+                    await load_pending_details(browser, current_page_judgments, concurrency)
                     
-                    table_data = []
-                    for idx, judgment in enumerate(current_page_judgments, start_idx + 1):
-                        table_data.append({
-                            "序號": idx,
-                            "裁判字號": judgment["case_number"],
-                            "裁判日期": judgment["case_date"],
-                            "裁判案由": judgment["case_reason"]
-                        })
-                    
-                    df = pd.DataFrame(table_data)
-                    df = df.reset_index(drop=True)
-                    st.table(df.style.hide(axis="index"))
+                    # 每個顯示頁的表格只建立一次，詳細資訊更新時才重建
+                    page_table = st.session_state.page_tables.get(st.session_state.current_display_page)
+                    if page_table is None:
+                        table_data = []
+                        for idx, judgment in enumerate(current_page_judgments, start_idx + 1):
+                            table_data.append({
+                                "序號": idx,
+                                "裁判字號": judgment["case_number"],
+                                "裁判日期": judgment["case_date"],
+                                "裁判案由": judgment["case_reason"]
+                            })
+                        
+                        df = pd.DataFrame(table_data)
+                        df = df.reset_index(drop=True)
+                        page_table = df.style.hide(axis="index")
+                        st.session_state.page_tables[st.session_state.current_display_page] = page_table
+                    st.table(page_table)
                     
                     if st.button(f"下載當前頁 PDF（{len(current_page_judgments)} 筆）"):
                         st.session_state.batch_download = True
@@ -642,122 +440,105 @@ async def main_async():
                         st.session_state.download_all = True
                 
                 with col2:
-                    st.download_button(
-                        label="下載查詢結果清單 (Excel)",
-                        data=open(st.session_state.excel_file, "rb"),
-                        file_name=f"{keyword}_裁判書查詢結果.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
+                    await export_button(browser, "xlsx", "Excel", keyword, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", concurrency)
 
                 with col3:
-                    st.download_button(
-                        label="下載查詢結果清單 (csv)",
-                        data=open(st.session_state.csv_file, "rb"),
-                        file_name=f"{keyword}_裁判書查詢結果.csv",
-                        mime="text/csv"
-                    )
+                    await export_button(browser, "csv", "csv", keyword, "text/csv", concurrency)
         
         if st.session_state.get("batch_download", False) and st.session_state.get("batch_judgments"):
-            judgments_batch = st.session_state.batch_judgments
-            total = len(judgments_batch)
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            status_text.text(f"準備下載 {total} 筆判決文件...")
-            
-            temp_dir = tempfile.mkdtemp()
-            
-            with st.spinner(f"正在下載 {total} 筆判決..."):
-                downloaded_files, errors = await batch_download_pdfs(context, judgments_batch, temp_dir, progress_bar, status_text)
-            
-            if downloaded_files:
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                zip_filename = f"裁判書合集_{timestamp}.zip"
-                zip_path = os.path.join(temp_dir, zip_filename)
-                
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    for file in downloaded_files:
-                        zipf.write(file, os.path.basename(file))
-                
-                with open(zip_path, "rb") as f:
-                    st.download_button(
-                        label=f"點擊下載 {len(downloaded_files)} 筆裁判書 (ZIP)",
-                        data=f,
-                        file_name=zip_filename,
-                        mime="application/zip"
-                    )
-                
-                st.success(f"已成功下載 {len(downloaded_files)}/{total} 個裁判書")
-                
-                if errors:
-                    st.warning("部分裁判書下載失敗:")
-                    for error in errors:
-                        st.error(error)
-            else:
-                st.error("沒有任何裁判書下載成功")
-            
-            for file in downloaded_files:
-                if os.path.exists(file):
-                    os.remove(file)
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-            os.rmdir(temp_dir)
+            await load_pending_details(browser, st.session_state.batch_judgments, concurrency)
+            await download_pdfs_as_zip(
+                await browser.get(),
+                st.session_state.batch_judgments,
+                "裁判書合集",
+                "點擊下載 {count} 筆裁判書 (ZIP)",
+                concurrency,
+                zip_volume_mb
+            )
             
             st.session_state.batch_download = False
             st.session_state.batch_judgments = None
         
         if st.session_state.get("download_all", False) and st.session_state.get("judgments"):
-            judgments = st.session_state.judgments
-            total = len(judgments)
-            
-            download_progress = st.progress(0)
-            download_status = st.empty()
-            download_status.text(f"準備下載 {total} 筆判決文件...")
-            
-            temp_dir = tempfile.mkdtemp()
-            downloaded_files = []
-            download_errors = []
-            
-            with st.spinner(f"正在下載全部 {total} 筆判決..."):
-                downloaded_files, download_errors = await batch_download_pdfs(context, judgments, temp_dir, download_progress, download_status)
-            
-            if downloaded_files:
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                zip_filename = f"裁判書合集_全部_{timestamp}.zip"
-                zip_path = os.path.join(temp_dir, zip_filename)
-                
-                with zipfile.ZipFile(zip_path, 'w') as zipf:
-                    for file in downloaded_files:
-                        zipf.write(file, os.path.basename(file))
-                
-                with open(zip_path, "rb") as f:
-                    st.download_button(
-                        label=f"點擊下載所有裁判書 (ZIP)",
-                        data=f,
-                        file_name=zip_filename,
-                        mime="application/zip"
-                    )
-                
-                st.success(f"已成功下載 {len(downloaded_files)}/{total} 個裁判書")
-                
-                if download_errors:
-                    st.warning("部分裁判書下載失敗:")
-                    for error in download_errors:
-                        st.error(error)
-            else:
-                st.error("沒有任何裁判書下載成功")
-            
-            for file in downloaded_files:
-                if os.path.exists(file):
-                    os.remove(file)
-            if os.path.exists(zip_path):
-                os.remove(zip_path)
-            os.rmdir(temp_dir)
+            await load_pending_details(browser, st.session_state.judgments, concurrency)
+            await download_pdfs_as_zip(
+                await browser.get(),
+                st.session_state.judgments,
+                "裁判書合集_全部",
+                "點擊下載所有裁判書 (ZIP)",
+                concurrency,
+                zip_volume_mb
+            )
             
             st.session_state.download_all = False
+        
+        if st.session_state.get("search_completed", False):
+            await prefetch_details(browser, st.session_state.judgments, concurrency)
+
+def show_cache_stats():
+    """在側邊欄顯示本機快取的命中統計（本行程累計）"""
+    stats = get_judgment_cache().stats
+    with st.sidebar:
+        st.markdown("## 📦 本機快取")
+        col1, col2 = st.columns(2)
+        col1.metric("詳細資訊命中", stats["detail_hits"])
+        col2.metric("詳細資訊未命中", stats["detail_misses"])
+        col1.metric("PDF 命中", stats["pdf_hits"])
+        col2.metric("PDF 未命中", stats["pdf_misses"])
+        col1.metric("PDF 共用內容", stats["pdf_shared"])
+
+def show_scheduler_stats():
+    """請求排程器的重試次數、各主機目前的限速狀態與自動逾時依據的延遲"""
+    scheduler = get_scheduler().snapshot()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("請求", scheduler["requests"])
+    col2.metric("重試", scheduler["retries"])
+    col3.metric("失敗", scheduler["failures"])
+    if scheduler["hosts"]:
+        st.dataframe(pd.DataFrame([
+            {"主機": host, "速率 (次/秒)": stats["rate"], "同時上限": stats["limit"], "進行中": stats["in_flight"]}
+            for host, stats in scheduler["hosts"].items()
+        ]), hide_index=True)
+    if scheduler["latency"]:
+        st.dataframe(pd.DataFrame([
+            {"等待階段": stage, "樣本數": stats["count"], "p50 (秒)": stats["p50"], "p95 (秒)": stats["p95"]}
+            for stage, stats in scheduler["latency"].items()
+        ]), hide_index=True)
+
+def show_metrics():
+    """在側邊欄顯示各處理階段的耗時統計（本行程累計），並提供匯出"""
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+    if not snapshot:
+        return
+    with st.sidebar:
+        with st.expander("⏱️ 效能指標"):
+            st.dataframe(pd.DataFrame([
+                {
+                    "階段": STAGES.get(stage, stage),
+                    "次數": stats["count"],
+                    "錯誤": stats["errors"],
+                    "p50 (秒)": stats["p50"],
+                    "p95 (秒)": stats["p95"],
+                    "累計 (秒)": stats["total_seconds"],
+                }
+                for stage, stats in snapshot.items()
+            ]), hide_index=True)
+            show_scheduler_stats()
+            st.download_button("下載 JSON", metrics.to_json(), file_name="fjud_metrics.json", mime="application/json")
+            st.download_button("下載 Prometheus 格式", metrics.to_prometheus(), file_name="fjud_metrics.prom", mime="text/plain")
 
 def main():
-    asyncio.run(main_async())
+    try:
+        asyncio.run(main_async())
+    except BrowserBusyError as e:
+        # 不自動重試，避免每次重新執行都再排隊一次
+        st.error(str(e))
+        st.session_state.search_clicked = False
+        st.session_state.download_all = False
+        st.session_state.batch_download = False
+    show_cache_stats()
+    show_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import os
+import zipfile
+
+from metrics import get_metrics
+
+# 每個壓縮檔項目除了檔案內容外，本機與中央目錄標頭約需的位元組數（含 ZIP64 欄位）
+ENTRY_OVERHEAD = 200
+
+
+def unique_name(name, names):
+    """檔名已在 names 中時加上編號（同一分卷或同一資料夾內不重複）"""
+    if name not in names:
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 2
+    while f"{stem}({n}){ext}" in names:
+        n += 1
+    return f"{stem}({n}){ext}"
+
+
+class StreamingZipWriter:
+    """邊下載邊寫入的 ZIP 壓縮檔
+
+    PDF 本身已經壓縮，因此項目一律以 ZIP_STORED 儲存；檔案下載完成後立即加入
+    壓縮檔並可刪除原檔，不必等全部下載完再重讀一次。設定 max_volume_bytes 時，
+    超過大小上限會自動開新的分卷。
+    """
+
+    def __init__(self, folder, base_name, max_volume_bytes=None):
+        self.folder = folder
+        self.base_name = base_name
+        self.max_volume_bytes = max_volume_bytes or None
+        self.volumes = []
+        self.file_count = 0
+        self._zip = None
+        self._volume_size = 0
+        self._names = set()
+        self._closed = False
+
+    def _volume_path(self, number):
+        if self.max_volume_bytes:
+            return os.path.join(self.folder, f"{self.base_name}_part{number}.zip")
+        return os.path.join(self.folder, f"{self.base_name}.zip")
+
+    def _open_volume(self):
+        if self._zip:
+            self._zip.close()
+        path = self._volume_path(len(self.volumes) + 1)
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._volume_size = 0
+        self._names = set()
+        self.volumes.append(path)
+
+    def add_file(self, path, arcname=None, remove_source=True):
+        """將檔案加入壓縮檔，預設加入後刪除原檔以節省暫存空間"""
+        size = os.path.getsize(path)
+        arcname = arcname or os.path.basename(path)
+        entry_size = size + ENTRY_OVERHEAD + 2 * len(arcname.encode("utf-8"))
+
+        if self._zip is None:
+            self._open_volume()
+        elif self.max_volume_bytes and self._names and self._volume_size + entry_size > self.max_volume_bytes:
+            self._open_volume()
+
+        arcname = unique_name(arcname, self._names)
+        with get_metrics().timer("zip_build"):
+            self._zip.write(path, arcname, compress_type=zipfile.ZIP_STORED)
+        self._names.add(arcname)
+        self._volume_size += entry_size
+        self.file_count += 1
+
+        if remove_source:
+            os.remove(path)
+
+    def close(self):
+        """完成壓縮檔並回傳所有分卷路徑；只有一個分卷時改用不含分卷編號的檔名"""
+        if self._closed:
+            return self.volumes
+        self._closed = True
+        if self._zip:
+            self._zip.close()
+            self._zip = None
+        if self.max_volume_bytes and len(self.volumes) == 1:
+            single_path = os.path.join(self.folder, f"{self.base_name}.zip")
+            os.replace(self.volumes[0], single_path)
+            self.volumes = [single_path]
+        return self.volumes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
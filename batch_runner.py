@@ -0,0 +1,179 @@
+"""多關鍵字批次查詢：把關鍵字分派給多個工作行程，每個行程使用自己的瀏覽器
+
+工作行程從共用的佇列領取關鍵字，查詢結果送回主行程後立即寫入合併輸出：
+    *_合併結果.jsonl   每份判決只出現一次（依判決網址去除重複），附上最先找到它的關鍵字
+    *_關鍵字來源.csv   每個關鍵字找到的每一筆判決（含重複），記錄結果的來源
+全部關鍵字完成後，再從合併結果產生指定格式的匯出檔。
+"""
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import sys
+
+from exports import write_export
+from judgment_cache import judgment_key
+from judgment_core import print_status
+
+# 預設的工作行程數量：每個行程各自啟動一個 Chromium，且都對同一個網站發出請求，
+# 行程越多每個行程分到的請求速率越低，因此預設只用少量行程
+BATCH_WORKERS = min(2, os.cpu_count() or 1)
+# 等待工作行程回報時，每隔多久檢查一次行程是否仍在執行（秒）
+WORKER_POLL_INTERVAL = 1.0
+
+# 合併結果中每筆判決保留的欄位
+MERGED_FIELDS = ("url", "case_number", "case_date", "case_reason", "case_text", "pdf_url", "file_name")
+PROVENANCE_HEADER = ["查詢關鍵字", "裁判字號", "裁判日期", "判決網址", "是否重複"]
+
+
+def read_keywords(path):
+    """讀取關鍵字檔（每行一個，忽略空白行與 # 開頭的註解），重複的關鍵字只保留一次"""
+    keywords = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for line in f:
+            keyword = line.strip()
+            if keyword and not keyword.startswith("#") and keyword not in keywords:
+                keywords.append(keyword)
+    return keywords
+
+
+async def worker_loop(worker_id, options, tasks, results):
+    """在同一個瀏覽器上下文中依序處理領到的關鍵字"""
+    from judgment_core import fetch_judgments, fetch_judgments_partitioned, get_browser_context
+
+    def on_status(message):
+        print(f"[{worker_id}] {message}", file=sys.stderr, flush=True)
+
+    async with get_browser_context(block=options["block"]) as context:
+        while True:
+            keyword = tasks.get()
+            if keyword is None:
+                return
+            on_status(f"=== {keyword} ===")
+            try:
+                if options["partition"]:
+                    judgments, _ = await fetch_judgments_partitioned(
+                        context, keyword, options["date_from"], options["date_to"], options["concurrency"],
+                        lazy=options["lazy"], on_status=on_status
+                    )
+                else:
+                    judgments, _ = await fetch_judgments(
+                        context, keyword, options["max_pages"], options["concurrency"],
+                        lazy=options["lazy"], on_status=on_status
+                    )
+            except Exception as e:
+                results.put((keyword, None, f"{type(e).__name__}: {e}"))
+                continue
+            results.put((keyword, [{field: judgment.get(field) for field in MERGED_FIELDS} for judgment in judgments], None))
+
+
+def worker_main(worker_id, workers, options, tasks, results):
+    """工作行程的進入點（以 spawn 啟動，瀏覽器服務與快取都在行程內重新建立）"""
+    from request_scheduler import share_limits
+
+    # 各行程的排程器互不相通，平分速率與同時請求數，使總量與單一行程相同
+    share_limits(workers)
+    if options.get("trace"):
+        from metrics import get_metrics
+
+        get_metrics().set_trace_file(options["trace"])
+    asyncio.run(worker_loop(worker_id, options, tasks, results))
+
+
+class MergedOutput:
+    """將各關鍵字的結果逐筆寫入合併輸出，並依判決網址去除重複"""
+
+    def __init__(self, output_folder, name):
+        self.merged_path = os.path.join(output_folder, f"{name}_合併結果.jsonl")
+        self.provenance_path = os.path.join(output_folder, f"{name}_關鍵字來源.csv")
+        # 只在記憶體中保留判決鍵與找到它的關鍵字，全文直接寫入磁碟
+        self.sources = {}
+        self._merged = open(self.merged_path, "w", encoding="utf-8")
+        self._provenance_file = open(self.provenance_path, "w", newline="", encoding="utf-8-sig")
+        self._provenance = csv.writer(self._provenance_file)
+        self._provenance.writerow(PROVENANCE_HEADER)
+
+    def add(self, keyword, judgments):
+        """加入一個關鍵字的結果，回傳新增（先前未出現過）的筆數"""
+        added = 0
+        for judgment in judgments:
+            key = judgment_key(judgment["url"])
+            duplicate = key in self.sources
+            if not duplicate:
+                self.sources[key] = []
+                self._merged.write(json.dumps(dict(judgment, keyword=keyword), ensure_ascii=False) + "\n")
+                added += 1
+            self.sources[key].append(keyword)
+            self._provenance.writerow([
+                keyword, judgment["case_number"], judgment["case_date"], judgment["url"], "是" if duplicate else "否"
+            ])
+        self._merged.flush()
+        self._provenance_file.flush()
+        return added
+
+    def judgments(self):
+        """依寫入順序逐筆讀回合併結果"""
+        with open(self.merged_path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        self._merged.close()
+        self._provenance_file.close()
+
+
+def run_batch(keywords, options, output_folder, name, fmt, workers=BATCH_WORKERS, on_status=print_status):
+    """以多個工作行程查詢關鍵字並合併結果，回傳 (合併輸出, 失敗的關鍵字清單)"""
+    os.makedirs(output_folder, exist_ok=True)
+    workers = max(1, min(workers, len(keywords)))
+    # Playwright 與 Chromium 子行程不適合 fork，一律以 spawn 啟動工作行程
+    mp = multiprocessing.get_context("spawn")
+    tasks = mp.Queue()
+    results = mp.Queue()
+    for keyword in keywords:
+        tasks.put(keyword)
+    for _ in range(workers):
+        tasks.put(None)
+
+    processes = [
+        mp.Process(target=worker_main, args=(f"w{n}", workers, options, tasks, results), daemon=True)
+        for n in range(1, workers + 1)
+    ]
+    for process in processes:
+        process.start()
+    on_status(f"以 {workers} 個工作行程查詢 {len(keywords)} 個關鍵字")
+
+    output = MergedOutput(output_folder, name)
+    remaining = set(keywords)
+    failed = []
+    try:
+        while remaining:
+            try:
+                keyword, judgments, error = results.get(timeout=WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    on_status(f"工作行程已全部結束，{len(remaining)} 個關鍵字未完成")
+                    failed.extend(keyword for keyword in keywords if keyword in remaining)
+                    break
+                continue
+            remaining.discard(keyword)
+            done = len(keywords) - len(remaining)
+            if error or not judgments:
+                failed.append(keyword)
+                on_status(f"[{done}/{len(keywords)}] {keyword}: {error or '沒有找到符合條件的裁判書'}")
+                continue
+            added = output.add(keyword, judgments)
+            on_status(f"[{done}/{len(keywords)}] {keyword}: {len(judgments)} 筆，新增 {added} 筆（累計 {len(output.sources)} 筆）")
+    finally:
+        output.close()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    if output.sources:
+        export_path = os.path.join(output_folder, f"{name}_裁判書查詢結果.{fmt}")
+        on_status(f"已建立合併匯出檔: {write_export(output.judgments(), fmt, export_path)}")
+    return output, failed
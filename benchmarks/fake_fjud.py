@@ -0,0 +1,258 @@
+"""模擬司法院裁判書系統的本機伺服器，供離線效能測試使用
+
+只實作本工具會用到的頁面與元素：
+    /FJUD/default.aspx      簡易查詢（#txtKW、#btnSimpleQry），送出後顯示 iframe-data
+    /FJUD/Default_AD.aspx   進階查詢（#jud_kw、裁判日期欄位、#btnQry）
+    /FJUD/data.aspx         結果清單（hlTitle 連結、#hlNext、#divPager），帶 id 參數時為裁判書頁面
+    /EXPORTFILE/reformat.aspx  PDF 匯出
+
+延遲、錯誤率、每個關鍵字的結果筆數與 PDF 大小都可以設定。關鍵字中含有
+「n=數字」時以該數字作為結果筆數，方便同時測試不同大小的結果集。
+
+    python benchmarks/fake_fjud.py --port 8765 --latency 0.05 --error-rate 0.01
+    FJUD_SITE_ROOT=http://127.0.0.1:8765 streamlit run app.py
+"""
+import argparse
+import datetime
+import hashlib
+import html
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+PAGE_SIZE = 20
+# 與真實系統相同，每次查詢最多只列出 500 筆
+RESULT_CAP = 500
+FIRST_DATE = datetime.date(2000, 1, 1)
+LAST_DATE = datetime.date(2023, 12, 31)
+
+
+@dataclass
+class FakeConfig:
+    results: int = 200
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    pdf_kb: int = 200
+    seed: int = 0
+
+
+def result_count(config, keyword):
+    match = re.search(r"n=(\d+)", keyword)
+    return int(match.group(1)) if match else config.results
+
+
+def judgment_id(keyword, index):
+    digest = hashlib.sha1(keyword.encode("utf-8")).hexdigest()[:8]
+    return f"FAKE,{digest},{index}"
+
+
+def judgment_date(index, total):
+    span = (LAST_DATE - FIRST_DATE).days
+    return FIRST_DATE + datetime.timedelta(days=span * index // max(total, 1))
+
+
+def parse_roc_date(year, month, day):
+    try:
+        return datetime.date(int(year) + 1911, int(month), int(day))
+    except (TypeError, ValueError):
+        return None
+
+
+def matching_indexes(config, keyword, date_from=None, date_to=None):
+    """符合查詢條件的判決編號（依日期由新到舊）"""
+    total = result_count(config, keyword)
+    indexes = [
+        i for i in range(total)
+        if (date_from is None or judgment_date(i, total) >= date_from)
+        and (date_to is None or judgment_date(i, total) <= date_to)
+    ]
+    return indexes[::-1]
+
+
+def page_html(title, body):
+    return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(title)}</title>
+<link rel="stylesheet" href="/static/site.css"></head>
+<body>{body}<img src="/static/logo.png" alt=""></body></html>"""
+
+
+class FakeFJUDHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type="text/html; charset=utf-8", status=200):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        path = parts.path.lower()
+
+        if path.startswith("/static/"):
+            self.send_body(b"", "application/octet-stream")
+            return
+
+        delay = max(0.0, random.gauss(self.config.latency, self.config.jitter))
+        if delay:
+            time.sleep(delay)
+        if random.random() < self.config.error_rate:
+            self.send_body(page_html("Service Unavailable", "<h1>503</h1>"), status=503)
+            return
+
+        if path == "/fjud/default.aspx":
+            self.send_body(self.search_page(params))
+        elif path == "/fjud/default_ad.aspx":
+            self.send_body(self.advanced_search_page(params))
+        elif path == "/fjud/data.aspx" and "id" in params:
+            self.send_body(self.detail_page(params["id"]))
+        elif path == "/fjud/data.aspx":
+            self.send_body(self.list_page(params))
+        elif path == "/exportfile/reformat.aspx":
+            self.send_body(self.pdf(params.get("id", "")), "application/pdf")
+        else:
+            self.send_body(page_html("Not Found", "<h1>404</h1>"), status=404)
+
+    def result_frame(self, keyword, date_from=None, date_to=None):
+        count = len(matching_indexes(self.config, keyword, date_from, date_to))
+        query = {"ty": "JUDBOOK", "q": keyword}
+        if date_from and date_to:
+            query["sdate"] = date_from.isoformat()
+            query["edate"] = date_to.isoformat()
+        return (f'<div class="result-count">共 {count} 筆</div>'
+                f'<iframe id="iframe-data" name="iframe-data" src="data.aspx?{urlencode(query)}"></iframe>')
+
+    def search_page(self, params):
+        keyword = params.get("kw", "")
+        body = ('<form method="get" action="default.aspx">'
+                f'<input id="txtKW" name="kw" value="{html.escape(keyword)}">'
+                '<input type="submit" id="btnSimpleQry" value="送出查詢"></form>')
+        if keyword:
+            body += self.result_frame(keyword)
+        return page_html("裁判書查詢", body)
+
+    def advanced_search_page(self, params):
+        keyword = params.get("jud_kw", "")
+        fields = "".join(f'<input id="{name}" name="{name}" value="{html.escape(params.get(name, ""))}">'
+                         for name in ("dy1", "dm1", "dd1", "dy2", "dm2", "dd2"))
+        body = ('<form method="get" action="Default_AD.aspx">'
+                f'<input id="jud_kw" name="jud_kw" value="{html.escape(keyword)}">{fields}'
+                '<input type="submit" id="btnQry" value="送出查詢"></form>')
+        if keyword:
+            date_from = parse_roc_date(params.get("dy1"), params.get("dm1"), params.get("dd1"))
+            date_to = parse_roc_date(params.get("dy2"), params.get("dm2"), params.get("dd2"))
+            body += self.result_frame(keyword, date_from, date_to)
+        return page_html("裁判書進階查詢", body)
+
+    def list_page(self, params):
+        keyword = params.get("q", "")
+        date_from = datetime.date.fromisoformat(params["sdate"]) if params.get("sdate") else None
+        date_to = datetime.date.fromisoformat(params["edate"]) if params.get("edate") else None
+        indexes = matching_indexes(self.config, keyword, date_from, date_to)
+        listed = indexes[:RESULT_CAP]
+        total_pages = max(1, -(-len(listed) // PAGE_SIZE))
+        page = min(max(int(params.get("page", "1") or 1), 1), total_pages)
+
+        total = result_count(self.config, keyword)
+        rows = []
+        for n, i in enumerate(listed[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]):
+            jid = quote(judgment_id(keyword, i))
+            rows.append(f'<tr><td><a id="hlTitle_{n}" href="data.aspx?ty=JD&amp;id={jid}">'
+                        f'模擬法院 {judgment_date(i, total).year} 年度模字第 {i + 1} 號民事判決</a></td></tr>')
+
+        body = f'<div>共 {len(indexes)} 筆</div><table>{"".join(rows)}</table>'
+        body += f'<div id="divPager">第 {page} 頁 / 共 {total_pages} 頁</div>'
+        if page < total_pages:
+            next_query = dict(params, page=str(page + 1))
+            body += f'<a id="hlNext" href="data.aspx?{html.escape(urlencode(next_query))}">下一頁</a>'
+        return page_html("查詢結果", body)
+
+    def detail_page(self, jid):
+        _, digest, index = (jid.split(",") + ["", "", "0"])[:3]
+        index = int(index) if index.isdigit() else 0
+        rng = random.Random(f"{self.config.seed}:{jid}")
+        paragraphs = "".join(
+            f"<div>{'模擬裁判理由內容' * rng.randint(5, 30)}</div>" for _ in range(rng.randint(5, 40))
+        )
+        rows = [
+            ("裁判字號：", f"模擬法院 模字第 {index + 1} 號民事判決（{digest}）"),
+            ("裁判日期：", "民國 112 年 01 月 01 日"),
+            ("裁判案由：", "模擬案由"),
+        ]
+        row_html = "".join(
+            f'<div class="row"><div class="col-th">{label}</div><div class="col-td">{html.escape(value)}</div></div>'
+            for label, value in rows
+        )
+        body = (f'<div id="jud">{row_html}'
+                f'<div class="htmlcontent"><div>主文</div>{paragraphs}</div>'
+                f'<a id="hlExportPDF" href="/EXPORTFILE/reformat.aspx?type=JD&amp;id={quote(jid)}">轉存PDF</a></div>')
+        return page_html("裁判書內容", body)
+
+    def pdf(self, jid):
+        header = f"%PDF-1.4\n% fake judgment {jid}\n".encode("utf-8")
+        return header + b"0" * max(0, self.config.pdf_kb * 1024 - len(header)) + b"\n%%EOF\n"
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """在背景執行緒啟動模擬伺服器，回傳 (伺服器, 站台根網址)"""
+    server = ThreadingHTTPServer((host, port), FakeFJUDHandler)
+    server.daemon_threads = True
+    server.config = FakeConfig(**options)
+    random.seed(server.config.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--results", type=int, default=FakeConfig.results, help="每個關鍵字的結果筆數")
+    parser.add_argument("--latency", type=float, default=FakeConfig.latency, help="每個請求的平均延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=FakeConfig.jitter, help="延遲的標準差（秒）")
+    parser.add_argument("--error-rate", type=float, default=FakeConfig.error_rate, help="回傳 503 的機率")
+    parser.add_argument("--pdf-kb", type=int, default=FakeConfig.pdf_kb, help="PDF 檔案大小（KB）")
+    parser.add_argument("--seed", type=int, default=FakeConfig.seed, help="亂數種子")
+
+
+def config_options(args):
+    return {
+        "results": args.results,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "pdf_kb": args.pdf_kb,
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模擬司法院裁判書系統的本機伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.host, args.port, **config_options(args))
+    print(f"模擬伺服器已啟動: {base_url}（設定 FJUD_SITE_ROOT={base_url} 即可連線）")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""對本機模擬站台執行效能測試，回報吞吐量與 p50/p95 延遲
+
+    python benchmarks/run_benchmarks.py --concurrency 1 5 10 --latency 0.05
+    python benchmarks/run_benchmarks.py --no-browser --json results.json
+
+每個情境在每個同時處理數量下執行 --repeat 次，每次都使用不同的關鍵字，
+確保不會命中前一次留下的快取。查詢情境需要 Playwright 的 Chromium；
+--no-browser 只測試詳細資訊（HTTP）與 PDF 批量下載。
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_fjud import (  # noqa: E402
+    PAGE_SIZE,
+    FakeConfig,
+    add_config_arguments,
+    config_options,
+    judgment_id,
+    matching_indexes,
+    start_server,
+)
+
+SCENARIOS = ("search", "details", "download")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+def summarize(scenario, concurrency, items, durations, latencies, errors):
+    total_time = sum(durations)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "runs": len(durations),
+        "items": items,
+        "errors": errors,
+        "throughput": round(items / total_time, 2) if total_time else None,
+        "p50": round(percentile(latencies, 0.5), 4) if latencies else None,
+        "p95": round(percentile(latencies, 0.95), 4) if latencies else None,
+    }
+
+
+class BenchmarkRunner:
+    def __init__(self, base_url, results, max_pages, repeat, use_browser):
+        self.base_url = base_url
+        self.results = results
+        self.max_pages = max_pages
+        self.repeat = repeat
+        self.use_browser = use_browser
+        self._run = 0
+
+    def keyword(self):
+        """每次執行使用新的關鍵字，模擬站台會產生不同的判決編號"""
+        self._run += 1
+        return f"bench{self._run} n={self.results}"
+
+    def judgment_ids(self, keyword):
+        """不經瀏覽器直接產生結果清單中的判決編號"""
+        indexes = matching_indexes(FakeConfig(results=self.results), keyword)
+        return [quote(judgment_id(keyword, i)) for i in indexes[:self.max_pages * PAGE_SIZE]]
+
+    async def bench_search(self, context, concurrency):
+        import judgment_core
+
+        durations = []
+        items = errors = 0
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            judgments, _ = await judgment_core.fetch_judgments(
+                context, self.keyword(), self.max_pages, concurrency, lazy=True, on_status=lambda message: None
+            )
+            durations.append(time.perf_counter() - start)
+            items += len(judgments)
+            errors += not judgments
+        return items, durations, durations, errors
+
+    async def bench_details(self, context, concurrency):
+        import judgment_core
+        from metrics import get_metrics
+
+        durations = []
+        items = errors = 0
+        for _ in range(self.repeat):
+            urls = [f"data.aspx?ty=JD&id={jid}" for jid in self.judgment_ids(self.keyword())]
+            start = time.perf_counter()
+            async with judgment_core.session_client(context) as client:
+                details = await judgment_core.fetch_details_batch(context, urls, concurrency, client)
+            durations.append(time.perf_counter() - start)
+            items += len(details)
+            errors += sum(d["case_number"] == "獲取失敗" for d in details)
+        return items, durations, get_metrics().samples("detail_http_fetch"), errors
+
+    async def bench_download(self, context, concurrency):
+        import judgment_core
+        from metrics import get_metrics
+
+        durations = []
+        items = errors = 0
+        for _ in range(self.repeat):
+            # 使用查詢時記錄的 PDF 連結，只量測下載本身
+            judgments = [
+                {
+                    "url": f"data.aspx?ty=JD&id={jid}",
+                    "case_number": jid,
+                    "pdf_url": f"{self.base_url}/EXPORTFILE/reformat.aspx?type=JD&id={jid}",
+                    "file_name": f"{n}.pdf",
+                }
+                for n, jid in enumerate(self.judgment_ids(self.keyword()))
+            ]
+            folder = tempfile.mkdtemp()
+            try:
+                start = time.perf_counter()
+                files, failures = await judgment_core.batch_download_pdfs(context, judgments, folder, concurrency)
+                durations.append(time.perf_counter() - start)
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+            items += len(files)
+            errors += len(failures)
+        return items, durations, get_metrics().samples("pdf_fetch"), errors
+
+    async def run(self, scenarios, concurrency_levels):
+        import judgment_core
+        from metrics import get_metrics
+
+        results = []
+        async with judgment_core.LazyBrowserContext() as browser:
+            for scenario in scenarios:
+                if scenario == "search" and not self.use_browser:
+                    continue
+                for concurrency in concurrency_levels:
+                    get_metrics().reset()
+                    context = await browser.get() if self.use_browser else None
+                    bench = getattr(self, f"bench_{scenario}")
+                    items, durations, latencies, errors = await bench(context, concurrency)
+                    summary = summarize(scenario, concurrency, items, durations, latencies, errors)
+                    results.append(summary)
+                    print(format_row(summary), flush=True)
+        return results
+
+
+def format_row(summary):
+    return (f"{summary['scenario']:<10}{summary['concurrency']:>6}{summary['items']:>8}{summary['errors']:>8}"
+            f"{summary['throughput'] or 0:>12.2f}{summary['p50'] or 0:>10.3f}{summary['p95'] or 0:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="對本機模擬站台執行效能測試")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 5, 10], help="要比較的同時處理數量")
+    parser.add_argument("--repeat", type=int, default=3, help="每個組合重複執行的次數")
+    parser.add_argument("--max-pages", type=int, default=2, help="查詢情境讀取的清單頁數")
+    parser.add_argument("--no-browser", action="store_true", help="不啟動瀏覽器，略過查詢情境")
+    parser.add_argument("--json", help="將結果寫入 JSON 檔案")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(**config_options(args))
+    cache_dir = tempfile.mkdtemp(prefix="fjud-bench-cache-")
+    # 核心模組在匯入時讀取這些設定，因此必須在匯入前設定
+    os.environ["FJUD_SITE_ROOT"] = base_url
+    os.environ["FJUD_CACHE_DIR"] = cache_dir
+    try:
+        if not args.no_browser:
+            from browser_service import ensure_playwright_browser
+
+            ensure_playwright_browser()
+
+        print(f"模擬站台: {base_url}")
+        print(f"{'scenario':<10}{'conc':>6}{'items':>8}{'errors':>8}{'items/s':>12}{'p50 (s)':>10}{'p95 (s)':>10}")
+        runner = BenchmarkRunner(base_url, args.results, args.max_pages, args.repeat, not args.no_browser)
+        results = asyncio.run(runner.run(args.scenarios, args.concurrency))
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"config": config_options(args), "results": results}, f, ensure_ascii=False, indent=2)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import asyncio
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import asynccontextmanager
+
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-software-rasterizer',
+    '--disable-accelerated-2d-canvas',
+    '--no-zygote',
+    '--single-process'
+]
+
+# 同時租用中的瀏覽器上下文數量上限（跨所有使用者工作階段）
+MAX_CONTEXTS = 4
+STARTUP_TIMEOUT = 30
+HEALTH_CHECK_TIMEOUT = 2
+# CDP 連線失敗時的嘗試次數與間隔（秒）；瀏覽器仍正常時只重試連線，不重新啟動
+CONNECT_ATTEMPTS = 3
+CONNECT_RETRY_DELAY = 0.5
+# 所有上下文都在使用中時，最多等待多久（秒）與每隔多久檢查一次是否有空位
+LEASE_TIMEOUT = 120
+LEASE_POLL_INTERVAL = 0.5
+
+
+def ensure_playwright_browser():
+    """確保 Playwright 的 Chromium 瀏覽器已安裝"""
+    browser_path = os.path.expanduser("~/.cache/ms-playwright/chromium-1097/chrome-linux/chrome")
+    if not os.path.exists(browser_path):
+        print("安裝 Playwright 瀏覽器...", file=sys.stderr)
+        try:
+            subprocess.run(["playwright", "install", "chromium"], check=True, stdout=sys.stderr)
+            try:
+                subprocess.run(["playwright", "install-deps", "chromium"], check=False, stdout=sys.stderr)
+            except:
+                pass
+            print("Playwright 瀏覽器安裝成功", file=sys.stderr)
+        except Exception as e:
+            print(f"安裝 Playwright 瀏覽器失敗: {e}", file=sys.stderr)
+            try:
+                subprocess.run(["python", "-m", "playwright", "install", "chromium"], check=True, stdout=sys.stderr)
+                try:
+                    subprocess.run(["python", "-m", "playwright", "install-deps", "chromium"], check=False, stdout=sys.stderr)
+                except:
+                    pass
+                print("使用 python -m 安裝 Playwright 瀏覽器成功", file=sys.stderr)
+            except Exception as e:
+                print(f"使用 python -m 安裝 Playwright 瀏覽器失敗: {e}", file=sys.stderr)
+
+
+class BrowserBusyError(RuntimeError):
+    """等待瀏覽器上下文逾時（同時使用的人數已達上限）"""
+
+
+class BrowserService:
+    """跨 Streamlit 重新執行與使用者工作階段共用的 Chromium 瀏覽器服務
+
+    Chromium 以獨立子行程啟動並開啟遠端除錯埠，各次執行只需透過 CDP 連線並
+    建立新的瀏覽器上下文，不必每次重新啟動瀏覽器。模組只會被匯入一次，因此
+    服務實例在整個行程中共用。
+    """
+
+    def __init__(self, max_contexts=MAX_CONTEXTS):
+        self._lock = threading.Lock()
+        self.max_contexts = max_contexts
+        self._slots = threading.BoundedSemaphore(max_contexts)
+        self._process = None
+        self._user_data_dir = None
+        self._endpoint = None
+        atexit.register(self.shutdown)
+
+    def _start(self, executable_path):
+        """啟動 Chromium 子行程並等待遠端除錯埠就緒"""
+        self._user_data_dir = tempfile.mkdtemp(prefix="fjud-chromium-")
+        self._process = subprocess.Popen(
+            [
+                executable_path,
+                "--headless=new",
+                "--remote-debugging-address=127.0.0.1",
+                "--remote-debugging-port=0",
+                f"--user-data-dir={self._user_data_dir}",
+                *CHROMIUM_ARGS,
+                "about:blank"
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        # Chromium 會把實際使用的連接埠寫入 DevToolsActivePort
+        port_file = os.path.join(self._user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                break
+            try:
+                with open(port_file, "r") as f:
+                    port = f.readline().strip()
+                if port:
+                    self._endpoint = f"http://127.0.0.1:{port}"
+                    print(f"共用瀏覽器已啟動: {self._endpoint}", file=sys.stderr)
+                    return self._endpoint
+            except FileNotFoundError:
+                pass
+            time.sleep(0.1)
+
+        self._stop()
+        raise RuntimeError("共用瀏覽器啟動失敗")
+
+    def _stop(self):
+        """結束 Chromium 子行程並清除使用者資料目錄"""
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._user_data_dir:
+            shutil.rmtree(self._user_data_dir, ignore_errors=True)
+        self._process = None
+        self._user_data_dir = None
+        self._endpoint = None
+
+    def is_healthy(self):
+        """檢查瀏覽器子行程是否存活且除錯端點可回應"""
+        if not self._process or self._process.poll() is not None or not self._endpoint:
+            return False
+        try:
+            with urllib.request.urlopen(self._endpoint + "/json/version", timeout=HEALTH_CHECK_TIMEOUT) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def ensure_started(self, executable_path):
+        """確保瀏覽器正在執行，必要時（首次使用或已崩潰）重新啟動"""
+        with self._lock:
+            if self.is_healthy():
+                return self._endpoint
+            if self._process:
+                print("共用瀏覽器無回應，重新啟動...", file=sys.stderr)
+                self._stop()
+            return self._start(executable_path)
+
+    def shutdown(self):
+        """行程結束時關閉瀏覽器"""
+        with self._lock:
+            self._stop()
+
+    async def _acquire(self, timeout, on_wait):
+        """取得一個上下文名額，逾時拋出 BrowserBusyError
+
+        以非阻塞方式輪詢而不是在執行緒中阻塞等待：工作階段重新執行而取消等待時，
+        不會留下之後才取得、卻沒有人歸還的名額。
+        """
+        if self._slots.acquire(blocking=False):
+            return
+        start = time.monotonic()
+        while True:
+            waited = time.monotonic() - start
+            if waited >= timeout:
+                if on_wait:
+                    on_wait(None)
+                raise BrowserBusyError(f"目前同時使用的人數已達上限（{self.max_contexts} 人），請稍後再試")
+            if on_wait:
+                on_wait(f"目前同時使用的人數已達上限，等待可用的瀏覽器（已等待 {int(waited)} 秒）...")
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+            if self._slots.acquire(blocking=False):
+                if on_wait:
+                    on_wait(None)
+                return
+
+    @asynccontextmanager
+    async def context(self, lease_timeout=LEASE_TIMEOUT, on_wait=None, **options):
+        """從服務租用一個瀏覽器上下文，離開時歸還
+
+        所有名額都在使用中時最多等待 lease_timeout 秒，期間以等待訊息呼叫
+        on_wait，取得名額（或放棄）後以 None 呼叫；逾時拋出 BrowserBusyError。
+        """
+        from playwright.async_api import async_playwright
+
+        await self._acquire(lease_timeout, on_wait)
+        playwright = None
+        browser = None
+        context = None
+        try:
+            playwright = await async_playwright().start()
+            executable_path = playwright.chromium.executable_path
+            for attempt in range(CONNECT_ATTEMPTS):
+                # 每次連線前都在鎖內重新檢查：只有瀏覽器確實無回應時才重新啟動，
+                # 以免單次連線失敗就結束其他工作階段正在使用的上下文
+                endpoint = await asyncio.to_thread(self.ensure_started, executable_path)
+                try:
+                    browser = await playwright.chromium.connect_over_cdp(endpoint)
+                    break
+                except Exception as e:
+                    if attempt == CONNECT_ATTEMPTS - 1:
+                        raise
+                    print(f"連線共用瀏覽器失敗，重試: {e}", file=sys.stderr)
+                    await asyncio.sleep(CONNECT_RETRY_DELAY)
+            context = await browser.new_context(**options)
+            yield context
+        finally:
+            try:
+                if context:
+                    await context.close()
+                # 透過 CDP 連線的瀏覽器，close() 只會中斷連線而不會結束子行程
+                if browser:
+                    await browser.close()
+                if playwright:
+                    await playwright.stop()
+            finally:
+                self._slots.release()
+
+
+browser_service = BrowserService()
@@ -0,0 +1,298 @@
+"""裁判書查詢與下載的命令列介面（不需要 Streamlit）
+
+範例：
+    python cli.py search "(法院+管轄)&公證處" --max-pages 5 --format xlsx --pdf
+    python cli.py search 關鍵字一 關鍵字二 --partition --date-from 2020-01-01 --date-to 2023-12-31
+    python cli.py batch keywords.txt --workers 4 --max-pages 25 --format xlsx
+    python cli.py watch 公證處 --pdf
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+
+from archive import StreamingZipWriter, unique_name
+from batch_runner import BATCH_WORKERS, read_keywords, run_batch
+from download_jobs import DownloadJob, cleanup_jobs, run_download_job
+from exports import EXPORTERS, write_export
+from judgment_cache import copy_file
+from metrics import get_metrics
+from judgment_core import (
+    DETAIL_CONCURRENCY,
+    MAX_RESULT_PAGES,
+    clean_filename,
+    fetch_judgments,
+    fetch_judgments_partitioned,
+    full_judgment_url,
+    get_browser_context,
+    print_status,
+)
+
+DEFAULT_OUTPUT_FOLDER = "./downloads"
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式錯誤（應為 YYYY-MM-DD）: {value}")
+
+
+def export_results(judgments, keyword, fmt, output_folder):
+    """將查詢結果寫入輸出資料夾，回傳檔案路徑"""
+    file_path = os.path.join(output_folder, f"{clean_filename(keyword)}_裁判書查詢結果.{fmt}")
+    return write_export(judgments, fmt, file_path)
+
+
+async def download_results(context, judgments, keyword, args):
+    """下載查詢結果的 PDF；中斷後重新執行相同指令會接續先前的下載工作"""
+    job = DownloadJob(judgments, keyword)
+
+    if args.zip:
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 每筆下載完成就加入壓縮檔；工作資料夾中的檔案留作續傳依據
+        with StreamingZipWriter(
+            args.output, f"{clean_filename(keyword)}_{timestamp}", args.zip_volume_mb * 1024 * 1024
+        ) as zip_writer:
+            downloaded_files, errors = await run_download_job(
+                context, job, args.concurrency, on_status=print_status,
+                on_file=lambda file_path, file_name: zip_writer.add_file(file_path, file_name, remove_source=False)
+            )
+        for zip_path in zip_writer.volumes:
+            print_status(f"已建立壓縮檔: {zip_path}")
+    else:
+        pdf_folder = os.path.join(args.output, clean_filename(keyword))
+        os.makedirs(pdf_folder, exist_ok=True)
+        # 不同判決的檔名可能相同，本次已寫入的檔名加上編號區分
+        written = set()
+
+        def copy_out(file_path, file_name):
+            name = unique_name(file_name, written)
+            written.add(name)
+            # 輸出檔是獨立的複本，使用者修改檔案不會影響快取
+            copy_file(file_path, os.path.join(pdf_folder, name))
+
+        downloaded_files, errors = await run_download_job(
+            context, job, args.concurrency, on_status=print_status, on_file=copy_out
+        )
+
+    print_status(f"已成功下載 {len(downloaded_files)}/{len(judgments)} 個裁判書")
+    for error in errors:
+        print_status(f"下載失敗 {error}")
+    if job.complete:
+        job.remove()
+    else:
+        job.release()
+        print_status("重新執行相同指令即可只重試失敗的項目")
+    return len(errors)
+
+
+async def run_search(args):
+    """依序查詢每個關鍵字，匯出結果並視需要下載 PDF"""
+    os.makedirs(args.output, exist_ok=True)
+    cleanup_jobs()
+    failures = 0
+
+    async with get_browser_context(block=False if args.no_block_resources else None) as context:
+        for keyword in args.keywords:
+            print_status(f"=== {keyword} ===")
+            if args.partition:
+                judgments, _ = await fetch_judgments_partitioned(
+                    context, keyword, args.date_from, args.date_to, args.concurrency,
+                    lazy=args.lazy, on_status=print_status
+                )
+            else:
+                judgments, _ = await fetch_judgments(
+                    context, keyword, args.max_pages, args.concurrency,
+                    lazy=args.lazy, on_status=print_status
+                )
+
+            if not judgments:
+                print_status("沒有找到符合條件的裁判書")
+                failures += 1
+                continue
+
+            file_path = export_results(judgments, keyword, args.format, args.output)
+            print(file_path)
+
+            if args.pdf or args.zip:
+                failures += await download_results(context, judgments, keyword, args) > 0
+
+    return 1 if failures else 0
+
+
+async def run_batch_command(args):
+    """以多個工作行程查詢關鍵字檔中的所有關鍵字，合併並去除重複後輸出"""
+    keywords = read_keywords(args.keyword_file)
+    if not keywords:
+        print_status(f"關鍵字檔中沒有關鍵字: {args.keyword_file}")
+        return 1
+    options = {
+        "max_pages": args.max_pages,
+        "concurrency": args.concurrency,
+        "partition": args.partition,
+        "date_from": args.date_from,
+        "date_to": args.date_to,
+        "lazy": args.lazy,
+        "block": False if args.no_block_resources else None,
+        "trace": args.trace,
+    }
+    name = clean_filename(os.path.splitext(os.path.basename(args.keyword_file))[0])
+    output, failed = await asyncio.to_thread(
+        run_batch, keywords, options, args.output, name, args.format, args.workers, print_status
+    )
+    print(output.merged_path)
+    print(output.provenance_path)
+    print_status(f"共 {len(keywords)} 個關鍵字，合併後 {len(output.sources)} 筆判決")
+    for keyword in failed:
+        print_status(f"查詢失敗: {keyword}")
+    return 1 if failed else 0
+
+
+async def run_watch(args):
+    """同步每個關鍵字：只讀取上次之後新出現的判決，輸出本次新增的部分"""
+    from watch import WatchState, sync_query
+
+    os.makedirs(args.output, exist_ok=True)
+    cleanup_jobs()
+    failures = 0
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    async with get_browser_context(block=False if args.no_block_resources else None) as context:
+        for keyword in args.keywords:
+            print_status(f"=== {keyword} ===")
+            state = WatchState(keyword)
+            try:
+                new_judgments = await sync_query(
+                    context, keyword, state, args.max_pages, args.concurrency, args.full, on_status=print_status
+                )
+            except Exception as e:
+                # 查詢失敗時不更新同步狀態，下次執行會重新同步
+                print_status(f"同步失敗: {e}")
+                failures += 1
+                continue
+            if not new_judgments:
+                print_status("沒有新的裁判書")
+                state.save()
+                continue
+
+            file_path = os.path.join(args.output, f"{clean_filename(keyword)}_新增_{timestamp}.{args.format}")
+            print(write_export(new_judgments, args.format, file_path))
+
+            if (args.pdf or args.zip) and await download_results(context, new_judgments, keyword, args):
+                # PDF 未全部下載時不更新狀態，下次同步會再列出這些判決並接續下載
+                failures += 1
+                continue
+            state.mark(new_judgments)
+            state.save()
+
+    return 1 if failures else 0
+
+
+async def run_local(args):
+    """在本機全文索引中檢索已讀取過的判決，不需連線司法院網站"""
+    from fulltext_index import QuerySyntaxError, get_fulltext_index
+
+    try:
+        results = get_fulltext_index().search(args.query, limit=args.limit)
+    except QuerySyntaxError as e:
+        print_status(str(e))
+        return 2
+    for result in results:
+        print("\t".join([result["case_date"], result["case_number"], result["case_reason"], full_judgment_url(result["url"])]))
+    print_status(f"找到 {len(results)} 筆")
+    return 0 if results else 1
+
+
+def add_query_arguments(parser):
+    """search 與 batch 共用的查詢選項"""
+    parser.add_argument("--max-pages", type=int, default=1,
+                        help=f"每個關鍵字查詢的頁數（每頁約20筆，最多 {MAX_RESULT_PAGES} 頁）")
+    parser.add_argument("--concurrency", type=int, default=DETAIL_CONCURRENCY,
+                        help="同時讀取詳細頁與下載 PDF 的數量")
+    parser.add_argument("--format", choices=sorted(EXPORTERS), default="csv", help="查詢結果清單的輸出格式")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_FOLDER, help="輸出資料夾")
+    parser.add_argument("--partition", action="store_true", help="依裁判日期自動分割查詢，突破 500 筆上限")
+    parser.add_argument("--date-from", type=parse_date, default=datetime.date(1991, 1, 1),
+                        help="分割查詢的裁判日期起（YYYY-MM-DD）")
+    parser.add_argument("--date-to", type=parse_date, default=datetime.date.today(),
+                        help="分割查詢的裁判日期迄（YYYY-MM-DD）")
+    parser.add_argument("--lazy", action="store_true",
+                        help="只取得清單，不讀取詳細內容（匯出的欄位會是「載入中...」）")
+    parser.add_argument("--no-block-resources", action="store_true",
+                        help="不攔截圖片、樣式與字型等資源（除錯用）")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="司法院裁判書查詢與批量下載工具（命令列版）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    search = subparsers.add_parser("search", help="查詢關鍵字並匯出結果")
+    search.add_argument("keywords", nargs="+", help="查詢關鍵字（可指定多個，依序查詢）")
+    add_query_arguments(search)
+    search.add_argument("--pdf", action="store_true", help="下載所有結果的 PDF")
+    search.add_argument("--zip", action="store_true", help="下載 PDF 並打包成 ZIP")
+    search.add_argument("--zip-volume-mb", type=int, default=0, help="ZIP 分卷大小上限（MB），0 表示不分卷")
+    search.set_defaults(handler=run_search, needs_browser=True)
+
+    batch = subparsers.add_parser("batch", help="以多個工作行程查詢關鍵字檔中的所有關鍵字並合併結果")
+    batch.add_argument("keyword_file", help="關鍵字檔（每行一個關鍵字，# 開頭為註解）")
+    batch.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                       help="工作行程數量（每個行程各自啟動一個瀏覽器，並平分對網站的請求速率）")
+    add_query_arguments(batch)
+    batch.set_defaults(handler=run_batch_command, needs_browser=True)
+
+    watch = subparsers.add_parser("watch", help="同步查詢：只讀取上次執行後新出現的判決並輸出新增部分")
+    watch.add_argument("keywords", nargs="+", help="查詢關鍵字（每個關鍵字各自記錄同步狀態）")
+    watch.add_argument("--max-pages", type=int, default=MAX_RESULT_PAGES,
+                       help=f"最多讀取的清單頁數（每頁約20筆，最多 {MAX_RESULT_PAGES} 頁）")
+    watch.add_argument("--concurrency", type=int, default=DETAIL_CONCURRENCY,
+                       help="同時讀取詳細頁與下載 PDF 的數量")
+    watch.add_argument("--format", choices=sorted(EXPORTERS), default="csv", help="新增結果的輸出格式")
+    watch.add_argument("--output", default=DEFAULT_OUTPUT_FOLDER, help="輸出資料夾")
+    watch.add_argument("--full", action="store_true",
+                       help="讀取全部清單頁（不在遇到已看過的判決時停止），補回較晚公告的判決")
+    watch.add_argument("--pdf", action="store_true", help="下載新判決的 PDF")
+    watch.add_argument("--zip", action="store_true", help="下載新判決的 PDF 並打包成 ZIP")
+    watch.add_argument("--zip-volume-mb", type=int, default=0, help="ZIP 分卷大小上限（MB），0 表示不分卷")
+    watch.add_argument("--no-block-resources", action="store_true",
+                       help="不攔截圖片、樣式與字型等資源（除錯用）")
+    watch.set_defaults(handler=run_watch, needs_browser=True)
+
+    local = subparsers.add_parser("local", help="在本機全文索引中檢索已讀取過的判決")
+    local.add_argument("query", help="檢索字詞（& 為且、+ 為或、- 為非）")
+    local.add_argument("--limit", type=int, default=None, help="最多顯示的筆數")
+    local.set_defaults(handler=run_local, needs_browser=False)
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--metrics", help="結束時寫出各階段耗時統計（.json 為 JSON，其他為 Prometheus 文字格式）")
+        subparser.add_argument("--trace", help="將每次量測逐筆寫入此 JSON Lines 檔案")
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if hasattr(args, "max_pages"):
+        args.max_pages = max(1, min(args.max_pages, MAX_RESULT_PAGES))
+    if hasattr(args, "concurrency"):
+        args.concurrency = max(1, args.concurrency)
+    if hasattr(args, "workers"):
+        args.workers = max(1, args.workers)
+
+    if args.needs_browser:
+        from browser_service import ensure_playwright_browser
+
+        ensure_playwright_browser()
+    if args.trace:
+        get_metrics().set_trace_file(args.trace)
+    try:
+        return asyncio.run(args.handler(args))
+    finally:
+        if args.metrics:
+            print_status(f"已寫出效能指標: {get_metrics().dump(args.metrics)}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+from judgment_cache import judgment_key, pdf_storage_name
+
+JOBS_FOLDER = os.environ.get("FJUD_JOBS_DIR", "./jobs")
+# 超過此時間未再執行的下載工作會被清除
+JOB_MAX_AGE = 7 * 24 * 3600
+# 使用中的工作每完成一筆就更新租約；超過此時間未更新的租約視為已中斷
+LEASE_TIMEOUT = 3600
+
+# 寫入 job.json 的判決欄位（不含全文，避免工作檔過大）
+JOB_FIELDS = ("url", "case_number", "case_reason", "pdf_url", "file_name")
+
+
+def job_id(judgments, name=""):
+    """由判決清單計算工作識別碼，同一批判決重新執行時會找到同一個工作"""
+    digest = hashlib.sha256(name.encode("utf-8"))
+    for judgment in judgments:
+        digest.update(b"\0" + judgment_key(judgment["url"]).encode("utf-8"))
+    return digest.hexdigest()[:24]
+
+
+class DownloadJob:
+    """可中斷後續傳的批量下載工作
+
+    每個工作有自己的資料夾：job.json 記錄判決清單，journal.jsonl 逐行附加每筆
+    判決的完成或失敗紀錄，files/ 保存已下載的 PDF。重新開啟同一工作時會重播
+    日誌，已完成且檔案仍在的判決直接略過，只重試失敗與尚未處理的部分。
+
+    不同工作階段可能同時開啟同一個工作（例如下載同一頁），因此每個實例在
+    leases/ 下建立自己的租約，並使用自己的暫存資料夾 tmp/<租約>；只有在沒有
+    其他有效租約時才會刪除工作資料夾。
+    """
+
+    def __init__(self, judgments, name="", folder=JOBS_FOLDER):
+        self.id = job_id(judgments, name)
+        self.name = name
+        self.folder = os.path.join(folder, self.id)
+        self.files_folder = os.path.join(self.folder, "files")
+        self.leases_folder = os.path.join(self.folder, "leases")
+        self.lease_id = uuid.uuid4().hex
+        self.lease_path = os.path.join(self.leases_folder, self.lease_id)
+        self.temp_folder = os.path.join(self.folder, "tmp", self.lease_id)
+        self.journal_path = os.path.join(self.folder, "journal.jsonl")
+        self.judgments = judgments
+        self.done = {}
+        self.failed = {}
+
+        os.makedirs(self.files_folder, exist_ok=True)
+        os.makedirs(self.leases_folder, exist_ok=True)
+        open(self.lease_path, "w").close()
+        # 已中斷的實例留下的暫存檔一律捨棄，其他工作階段正在使用的保留
+        active = self.active_leases()
+        temp_root = os.path.dirname(self.temp_folder)
+        if os.path.isdir(temp_root):
+            for lease in os.listdir(temp_root):
+                if lease not in active:
+                    shutil.rmtree(os.path.join(temp_root, lease), ignore_errors=True)
+        os.makedirs(self.temp_folder, exist_ok=True)
+
+        job_path = os.path.join(self.folder, "job.json")
+        if not os.path.exists(job_path):
+            with open(job_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "name": name,
+                    "created": time.time(),
+                    "judgments": [{field: judgment.get(field) for field in JOB_FIELDS} for judgment in judgments]
+                }, f, ensure_ascii=False)
+        self._replay()
+
+    def _replay(self):
+        """重播日誌，還原各判決最後一次的處理結果"""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 寫到一半中斷的最後一行
+                    continue
+                key = entry["key"]
+                if entry["status"] == "done":
+                    path = os.path.join(self.files_folder, entry["file"])
+                    if os.path.exists(path):
+                        self.done[key] = (path, entry["name"])
+                        self.failed.pop(key, None)
+                else:
+                    self.done.pop(key, None)
+                    self.failed[key] = entry["error"]
+
+    def active_leases(self):
+        """目前仍有效的租約（包含自己），同時刪除逾時的租約"""
+        return active_leases(self.folder)
+
+    def _append(self, entry):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pending(self):
+        """尚未完成（包含上次失敗）的判決"""
+        return [judgment for judgment in self.judgments if judgment_key(judgment["url"]) not in self.done]
+
+    def record(self, judgment, file_path, file_name, error):
+        """記錄一筆判決的處理結果；成功時把檔案搬進工作資料夾並回傳新路徑
+
+        file_name 是之後放進壓縮檔或複製到輸出資料夾時使用的原始檔名。
+        """
+        key = judgment_key(judgment["url"])
+        if os.path.exists(self.lease_path):
+            os.utime(self.lease_path)
+        if not file_path:
+            self.failed[key] = error
+            self._append({"key": key, "status": "failed", "error": error})
+            return None
+
+        stored_name = pdf_storage_name(judgment["url"])
+        stored_path = os.path.join(self.files_folder, stored_name)
+        os.replace(file_path, stored_path)
+        self.done[key] = (stored_path, file_name)
+        self.failed.pop(key, None)
+        self._append({"key": key, "status": "done", "file": stored_name, "name": file_name})
+        return stored_path
+
+    def completed_files(self):
+        """依判決清單順序回傳已下載的 (檔案路徑, 原始檔名)"""
+        for judgment in self.judgments:
+            entry = self.done.get(judgment_key(judgment["url"]))
+            if entry:
+                yield entry
+
+    def errors(self):
+        """失敗判決的錯誤訊息"""
+        by_key = {judgment_key(judgment["url"]): judgment for judgment in self.judgments}
+        return [f"{by_key[key]['case_number']}: {error}" for key, error in self.failed.items() if key in by_key]
+
+    @property
+    def complete(self):
+        return not self.pending()
+
+    def release(self):
+        """結束使用：刪除自己的租約與暫存資料夾（可重複呼叫）"""
+        shutil.rmtree(self.temp_folder, ignore_errors=True)
+        if os.path.exists(self.lease_path):
+            os.remove(self.lease_path)
+
+    def remove(self):
+        """結束使用並刪除工作資料夾（包含已下載的檔案）；仍有其他工作階段使用時保留"""
+        self.release()
+        if not self.active_leases():
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+
+async def run_download_job(context, job, concurrency, on_status=None, on_progress=None, on_file=None):
+    """只下載工作中尚未完成的判決，完成後回傳 (已下載檔案, 錯誤訊息)
+
+    on_file 以 (檔案路徑, 原始檔名) 呼叫：先前已完成的檔案立即回報，其餘在每筆
+    下載寫入日誌後回報，呼叫端可以邊下載邊加入壓縮檔。
+    """
+    from judgment_core import batch_download_pdfs
+
+    pending = job.pending()
+    finished = len(job.judgments) - len(pending)
+    if finished and on_status:
+        on_status(f"接續先前的下載工作：已完成 {finished}/{len(job.judgments)} 筆")
+    if on_file:
+        for file_path, file_name in job.completed_files():
+            on_file(file_path, file_name)
+
+    def record(judgment, file_path, file_name, error):
+        stored_path = job.record(judgment, file_path, file_name, error)
+        if stored_path and on_file:
+            on_file(stored_path, file_name)
+        return stored_path
+
+    if pending:
+        total = len(job.judgments)
+
+        def report_progress(fraction):
+            if on_progress:
+                on_progress((finished + fraction * len(pending)) / total)
+
+        await batch_download_pdfs(
+            context, pending, job.temp_folder, concurrency,
+            on_status=on_status, on_progress=report_progress, on_result=record
+        )
+
+    return [path for path, _ in job.completed_files()], job.errors()
+
+
+def active_leases(job_folder, timeout=LEASE_TIMEOUT):
+    """工作資料夾中仍有效的租約名稱，逾時的租約會被刪除"""
+    leases_folder = os.path.join(job_folder, "leases")
+    if not os.path.isdir(leases_folder):
+        return set()
+    active = set()
+    cutoff = time.time() - timeout
+    for lease in os.listdir(leases_folder):
+        path = os.path.join(leases_folder, lease)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+            else:
+                active.add(lease)
+        except OSError:
+            pass
+    return active
+
+
+def cleanup_jobs(max_age=JOB_MAX_AGE, folder=JOBS_FOLDER):
+    """刪除太久沒有再執行、且沒有工作階段正在使用的下載工作"""
+    if not os.path.isdir(folder):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        journal_path = os.path.join(path, "journal.jsonl")
+        try:
+            last_used = os.path.getmtime(journal_path if os.path.exists(journal_path) else path)
+            if last_used < cutoff and not active_leases(path):
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
@@ -0,0 +1,132 @@
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from judgment_core import full_judgment_url
+from metrics import get_metrics
+
+EXPORT_FOLDER = os.path.join(tempfile.gettempdir(), "fjud_exports")
+# 超過此時間未使用的匯出檔會被清除
+EXPORT_MAX_AGE = 6 * 3600
+
+EXPORT_HEADER = ["序號", "裁判字號", "裁判日期", "裁判案由", "判決網址", "裁判書全文"]
+
+
+def export_row(idx, judgment):
+    """一筆判決的匯出資料列"""
+    return [
+        idx,
+        judgment["case_number"],
+        judgment["case_date"],
+        judgment["case_reason"],
+        full_judgment_url(judgment["url"]),
+        judgment["case_text"]
+    ]
+
+
+def export_rows(judgments):
+    """逐筆產生匯出用的資料列"""
+    for idx, judgment in enumerate(judgments, 1):
+        yield export_row(idx, judgment)
+
+
+def digesting(judgments, digest):
+    """依序產生判決資料，同時把每筆的匯出資料列加入 digest（雜湊值作為匯出檔的快取鍵）"""
+    for idx, judgment in enumerate(judgments, 1):
+        digest.update(json.dumps(export_row(idx, judgment), ensure_ascii=False).encode("utf-8"))
+        yield judgment
+
+
+def create_excel(judgments, file_path):
+    """建立Excel檔案（write-only 串流模式，不在記憶體中保留整份工作表）"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(EXPORT_HEADER)
+
+    for row in export_rows(judgments):
+        ws.append(row)
+
+    wb.save(file_path)
+    return file_path
+
+
+def create_csv(judgments, file_path):
+    """建立CSV檔案"""
+    with open(file_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADER)
+        writer.writerows(export_rows(judgments))
+    return file_path
+
+
+def create_json(judgments, file_path):
+    """建立JSON檔案（每筆判決一個物件，逐筆寫出不在記憶體中組成整個清單）"""
+    keys = ["index", "case_number", "case_date", "case_reason", "url", "case_text"]
+    with open(file_path, "w", encoding="utf-8") as f:
+        separator = "[\n  "
+        for row in export_rows(judgments):
+            f.write(separator)
+            f.write(json.dumps(dict(zip(keys, row)), ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            separator = ",\n  "
+        f.write("[]" if separator.startswith("[") else "\n]")
+    return file_path
+
+
+EXPORTERS = {
+    "xlsx": create_excel,
+    "csv": create_csv,
+    "json": create_json,
+}
+
+
+def write_export(judgments, fmt, file_path):
+    """以指定格式寫出匯出檔"""
+    with get_metrics().timer("export_generation"):
+        return EXPORTERS[fmt](judgments, file_path)
+
+
+def get_export(judgments, fmt, digest=None):
+    """取得查詢結果的匯出檔，相同結果集共用同一個檔案
+
+    judgments 可以是只能讀取一次的產生器：雜湊值在寫出檔案的同時計算，全文
+    只會讀取一次。已知雜湊值（digest）且檔案仍存在時直接回傳，不讀取 judgments。
+    """
+    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+    if digest:
+        file_path = os.path.join(EXPORT_FOLDER, f"{digest}.{fmt}")
+        if os.path.exists(file_path):
+            # 更新修改時間，避免仍在使用的檔案被清除
+            os.utime(file_path)
+            return file_path
+
+    cleanup_exports()
+    fd, temp_path = tempfile.mkstemp(dir=EXPORT_FOLDER, suffix=f".{fmt}.part")
+    os.close(fd)
+    try:
+        computed = hashlib.sha256()
+        write_export(digesting(judgments, computed), fmt, temp_path)
+        file_path = os.path.join(EXPORT_FOLDER, f"{digest or computed.hexdigest()[:32]}.{fmt}")
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return file_path
+
+
+def cleanup_exports(max_age=EXPORT_MAX_AGE):
+    """刪除過期的匯出檔"""
+    if not os.path.isdir(EXPORT_FOLDER):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(EXPORT_FOLDER):
+        path = os.path.join(EXPORT_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from judgment_cache import CACHE_FOLDER, judgment_key
+
+INDEX_PATH = os.path.join(CACHE_FOLDER, "fulltext.sqlite3")
+
+# 中日韓文字（含相容字元與擴充區），連續的一段切成重疊的二元組
+CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿\U00020000-\U0002ffff]+")
+WORD_RE = re.compile(r"[0-9A-Za-z]+")
+
+# 司法院檢索語法：& 為且、+ 為或、- 為非，可用括號分組
+QUERY_TOKEN_RE = re.compile(r"\s*([&+\-()（）]|[^&+\-()（）\s]+)")
+OPERATORS = {"&": "AND", "+": "OR", "-": "NOT"}
+
+
+class QuerySyntaxError(ValueError):
+    """檢索式無法轉為全文索引查詢（例如以 - 開頭、+- 或括號不成對）"""
+
+
+def bigrams(text):
+    """將文字轉為索引用的詞元：中文切成二元組（每段最後一字另外保留），英數字保留整個字"""
+    tokens = []
+    position = 0
+    for match in CJK_RE.finditer(text):
+        tokens.extend(WORD_RE.findall(text[position:match.start()]))
+        run = match.group()
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+        position = match.end()
+    tokens.extend(WORD_RE.findall(text[position:]))
+    return tokens
+
+
+def term_query(term):
+    """把一個檢索詞轉為 FTS5 的片語查詢"""
+    tokens = []
+    for match in CJK_RE.finditer(term):
+        run = match.group()
+        if len(run) == 1:
+            # 單一字以前綴比對任何以該字開頭的詞元
+            tokens.append(f"{run}*")
+            continue
+        tokens.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+    for word in WORD_RE.findall(CJK_RE.sub(" ", term)):
+        tokens.append(f'"{word}"')
+    if not tokens:
+        return None
+    return tokens[0] if len(tokens) == 1 else "(" + " AND ".join(tokens) + ")"
+
+
+def to_fts_query(query):
+    """將使用者輸入的 &/+/- 檢索式轉為 FTS5 查詢式，無法解析時回傳 None"""
+    parts = []
+    expect_term = True
+    for token in QUERY_TOKEN_RE.findall(query):
+        token = {"（": "(", "）": ")"}.get(token, token)
+        if token in OPERATORS:
+            if expect_term:
+                if token == "-":
+                    # 「&-」即「且非」；開頭、「+-」或括號後的「-」無法以 FTS5 的
+                    # 二元 NOT 表示，回傳 None 而不是默默略過否定
+                    if parts and parts[-1] == "AND":
+                        parts[-1] = "NOT"
+                        continue
+                    return None
+                continue
+            parts.append(OPERATORS[token])
+            expect_term = True
+        elif token == "(":
+            if not expect_term:
+                parts.append("AND")
+            parts.append("(")
+            expect_term = True
+        elif token == ")":
+            if expect_term and parts and parts[-1] in OPERATORS.values():
+                parts.pop()
+            parts.append(")")
+            expect_term = False
+        else:
+            term = term_query(token)
+            if term is None:
+                continue
+            if not expect_term:
+                # 空白分隔的檢索詞視為「且」
+                parts.append("AND")
+            parts.append(term)
+            expect_term = False
+    while parts and parts[-1] in OPERATORS.values():
+        parts.pop()
+    if not parts or parts.count("(") != parts.count(")"):
+        return None
+    return " ".join(parts)
+
+
+class FullTextIndex:
+    """本機裁判書全文索引（SQLite FTS5，中文以二元組切詞）
+
+    索引只保存詞元不保存原文，原文仍由 judgment_cache 提供。裁判書內容公告後
+    不會變動，因此同一份判決只會索引一次。
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE NOT NULL,
+                url TEXT NOT NULL,
+                case_number TEXT,
+                case_date TEXT,
+                case_reason TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                case_number, case_reason, case_text, content='', tokenize='unicode61'
+            );
+        """)
+        self._db.commit()
+
+    def add(self, url, details):
+        """將一份判決加入索引（已索引過則略過），回傳是否有新增"""
+        key = judgment_key(url)
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM docs WHERE key = ?", (key,)).fetchone():
+                return False
+        tokens = [" ".join(bigrams(details.get(field) or "")) for field in ("case_number", "case_reason", "case_text")]
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO docs (key, url, case_number, case_date, case_reason) VALUES (?, ?, ?, ?, ?)",
+                (key, url, details["case_number"], details["case_date"], details["case_reason"])
+            )
+            if cursor.rowcount:
+                self._db.execute(
+                    "INSERT INTO docs_fts (rowid, case_number, case_reason, case_text) VALUES (?, ?, ?, ?)",
+                    (cursor.lastrowid, *tokens)
+                )
+            self._db.commit()
+        return bool(cursor.rowcount)
+
+    def search(self, query, urls=None, limit=None):
+        """以 &/+/- 檢索式搜尋索引，回傳依相關度排序的判決摘要
+
+        指定 urls 時只在這些判決中篩選（例如目前的查詢結果）。檢索式無法解析時
+        拋出 QuerySyntaxError，與查無結果的空清單區分。
+        """
+        fts_query = to_fts_query(query)
+        if fts_query is None:
+            raise QuerySyntaxError("無法解析檢索式：- 只能接在其他檢索詞之後（例如 法院-管轄 或 法院&-管轄），括號必須成對")
+        sql = ("SELECT docs.url, docs.case_number, docs.case_date, docs.case_reason "
+               "FROM docs_fts JOIN docs ON docs.id = docs_fts.rowid WHERE docs_fts MATCH ?")
+        params = [fts_query]
+        if urls is not None:
+            sql += " AND docs.key IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps([judgment_key(url) for url in urls], ensure_ascii=False))
+        sql += " ORDER BY rank"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            try:
+                rows = self._db.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                raise QuerySyntaxError(f"無法執行檢索式: {e}") from e
+        return [
+            {"url": url, "case_number": case_number, "case_date": case_date, "case_reason": case_reason}
+            for url, case_number, case_date, case_reason in rows
+        ]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+
+_fulltext_index = None
+_fulltext_index_lock = threading.Lock()
+
+
+def get_fulltext_index():
+    """取得行程共用的全文索引（第一次使用時才建立資料庫）"""
+    global _fulltext_index
+    with _fulltext_index_lock:
+        if _fulltext_index is None:
+            _fulltext_index = FullTextIndex()
+        return _fulltext_index
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+CACHE_FOLDER = os.environ.get("FJUD_CACHE_DIR", "./cache")
+
+# 裁判書公告後內容幾乎不會變動，預設保留 90 天
+CACHE_TTL = 90 * 24 * 3600
+MAX_DETAILS_BYTES = 512 * 1024 * 1024
+MAX_PDF_BYTES = 4 * 1024 * 1024 * 1024
+
+# 合法 PDF 的檔頭與結尾標記；結尾標記之後可能還有少量換行或空白
+PDF_MAGIC = b"%PDF-"
+PDF_EOF_MARKER = b"%%EOF"
+PDF_TAIL_BYTES = 1024
+MIN_PDF_BYTES = 64
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def validate_pdf(file_path, expected_size=None):
+    """檢查檔案是否為完整的 PDF（檔頭、結尾標記與長度），合法時回傳 None，否則回傳錯誤訊息"""
+    try:
+        size = os.path.getsize(file_path)
+    except OSError as e:
+        return f"無法讀取PDF檔案: {e}"
+    if expected_size is not None and size != expected_size:
+        return f"PDF檔案長度不符（{size}/{expected_size} bytes）"
+    if size < MIN_PDF_BYTES:
+        return f"PDF檔案過小（{size} bytes）"
+    with open(file_path, "rb") as f:
+        if not f.read(len(PDF_MAGIC)) == PDF_MAGIC:
+            return "下載內容不是PDF檔案"
+        f.seek(max(0, size - PDF_TAIL_BYTES))
+        if PDF_EOF_MARKER not in f.read():
+            return "PDF檔案不完整（缺少結尾標記）"
+    return None
+
+
+def file_sha256(file_path):
+    """計算檔案內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def judgment_key(url):
+    """將裁判書網址正規化為快取鍵（優先使用網址中的 JID）"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for name, value in query:
+        if name.lower() == "id" and value:
+            return unquote(value).strip()
+    # 沒有 id 參數時，以去除多餘差異的網址作為鍵
+    path = parts.path.lower()
+    if "/fjud/" in path:
+        path = path[path.index("/fjud/"):]
+    elif not path.startswith("/"):
+        path = "/fjud/" + path
+    return path + "?" + urlencode(sorted(query))
+
+
+class JudgmentCache:
+    """以 SQLite 保存裁判詳細資訊與 PDF 的本機快取，支援 TTL 與容量上限淘汰
+
+    PDF 以內容的 SHA-256 定址存放（pdfs/xx/<sha256>.pdf），每份判決（JID）只記錄
+    指向檔案的參照，相同內容只保存一份；不同查詢或批次下載同一份判決時直接以
+    硬連結取用既有檔案，不再重新下載。
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, ttl=CACHE_TTL,
+                 max_details_bytes=MAX_DETAILS_BYTES, max_pdf_bytes=MAX_PDF_BYTES):
+        self.folder = folder
+        self.pdf_folder = os.path.join(folder, "pdfs")
+        self.ttl = ttl
+        self.max_details_bytes = max_details_bytes
+        self.max_pdf_bytes = max_pdf_bytes
+        self.stats = {"detail_hits": 0, "detail_misses": 0, "pdf_hits": 0, "pdf_misses": 0, "pdf_shared": 0}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.pdf_folder, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(folder, "judgments.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS details (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pdf_blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pdf_refs (
+                key TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL REFERENCES pdf_blobs (sha256),
+                file_name TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pdf_refs_sha256 ON pdf_refs (sha256);
+        """)
+        self._db.commit()
+        self._migrate_pdfs()
+
+    def _migrate_pdfs(self):
+        """將舊版以網址命名的 PDF 快取搬進內容定址的存放區（只會執行一次）"""
+        if not self._db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'pdfs'").fetchone():
+            return
+        rows = self._db.execute("SELECT key, path, file_name, created, accessed FROM pdfs").fetchall()
+        for key, path, file_name, created, accessed in rows:
+            if os.path.exists(path) and validate_pdf(path) is None:
+                sha256, _ = self._store_blob(path)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO pdf_refs (key, sha256, file_name, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, sha256, file_name, created, accessed)
+                )
+            if os.path.exists(path):
+                os.remove(path)
+        self._db.execute("DROP TABLE pdfs")
+        self._db.commit()
+
+    def blob_path(self, sha256):
+        return os.path.join(self.pdf_folder, sha256[:2], sha256 + ".pdf")
+
+    def _store_blob(self, file_path):
+        """把檔案以內容雜湊存入存放區，回傳 (sha256, 是否為已存在的內容)"""
+        sha256 = file_sha256(file_path)
+        path = self.blob_path(sha256)
+        row = self._db.execute("SELECT size FROM pdf_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row and os.path.exists(path) and os.path.getsize(path) == row[0]:
+            return sha256, True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        copy_file(file_path, path, link=True)
+        self._db.execute(
+            "INSERT OR REPLACE INTO pdf_blobs (sha256, size, created) VALUES (?, ?, ?)",
+            (sha256, os.path.getsize(path), time.time())
+        )
+        return sha256, False
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get_details(self, url):
+        """讀取快取的裁判詳細資訊，不存在或已過期時回傳 None"""
+        key = judgment_key(url)
+        with self._lock:
+            row = self._db.execute("SELECT data, created FROM details WHERE key = ?", (key,)).fetchone()
+            if row and self._expired(row[1]):
+                self._db.execute("DELETE FROM details WHERE key = ?", (key,))
+                self._db.commit()
+                row = None
+            if not row:
+                self.stats["detail_misses"] += 1
+                return None
+            self._db.execute("UPDATE details SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.stats["detail_hits"] += 1
+        return json.loads(row[0])
+
+    def put_details(self, url, details):
+        """寫入裁判詳細資訊"""
+        data = json.dumps(details, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO details (key, data, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (judgment_key(url), data, len(data.encode("utf-8")), now, now)
+            )
+            self._evict_details()
+            self._db.commit()
+
+    def get_pdf(self, url):
+        """讀取快取的 PDF，回傳 (快取檔案路徑, 檔名)，不存在、已過期或檔案已損毀時回傳 None"""
+        key = judgment_key(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT pdf_refs.sha256, file_name, pdf_refs.created, size FROM pdf_refs "
+                "JOIN pdf_blobs ON pdf_blobs.sha256 = pdf_refs.sha256 WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                path = self.blob_path(row[0])
+                # 只比對長度；完整的內容檢查在寫入時已做過
+                if self._expired(row[2]) or not os.path.exists(path) or os.path.getsize(path) != row[3]:
+                    self._remove_pdf(key)
+                    self._db.commit()
+                    row = None
+            if not row:
+                self.stats["pdf_misses"] += 1
+                return None
+            self._db.execute("UPDATE pdf_refs SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            self.stats["pdf_hits"] += 1
+        return path, row[1]
+
+    def put_pdf(self, url, file_path, file_name=None):
+        """驗證已下載的 PDF 並存入快取，回傳存放區中的檔案路徑
+
+        檔案不是完整的 PDF 時拋出 ValueError。內容與既有檔案相同時只新增參照，
+        不另外保存一份。file_name 為顯示用的檔名，未指定時使用下載檔案的名稱。
+        """
+        error = validate_pdf(file_path)
+        if error:
+            raise ValueError(error)
+        key = judgment_key(url)
+        now = time.time()
+        with self._lock:
+            sha256, shared = self._store_blob(file_path)
+            if shared:
+                self.stats["pdf_shared"] += 1
+            previous = self._db.execute("SELECT sha256 FROM pdf_refs WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO pdf_refs (key, sha256, file_name, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, sha256, file_name or os.path.basename(file_path), now, now)
+            )
+            if previous and previous[0] != sha256:
+                self._remove_orphan_blob(previous[0])
+            self._evict_pdfs()
+            self._db.commit()
+        return self.blob_path(sha256)
+
+    def _remove_pdf(self, key):
+        row = self._db.execute("SELECT sha256 FROM pdf_refs WHERE key = ?", (key,)).fetchone()
+        self._db.execute("DELETE FROM pdf_refs WHERE key = ?", (key,))
+        if row:
+            self._remove_orphan_blob(row[0])
+
+    def _remove_orphan_blob(self, sha256):
+        """沒有任何判決參照的內容才刪除檔案"""
+        if self._db.execute("SELECT 1 FROM pdf_refs WHERE sha256 = ?", (sha256,)).fetchone():
+            return
+        self._db.execute("DELETE FROM pdf_blobs WHERE sha256 = ?", (sha256,))
+        path = self.blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _evict_details(self):
+        """依最近存取時間淘汰超出容量上限的詳細資訊"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM details").fetchone()[0]
+        if total <= self.max_details_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM details ORDER BY accessed").fetchall():
+            self._db.execute("DELETE FROM details WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_details_bytes:
+                break
+
+    def _evict_pdfs(self):
+        """依最近存取時間淘汰超出容量上限的 PDF（以實際保存的內容計算容量）"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_blobs").fetchone()[0]
+        if total <= self.max_pdf_bytes:
+            return
+        for (key,) in self._db.execute("SELECT key FROM pdf_refs ORDER BY accessed").fetchall():
+            self._remove_pdf(key)
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_blobs").fetchone()[0]
+            if total <= self.max_pdf_bytes:
+                break
+
+
+def pdf_storage_name(url):
+    """以判決鍵命名的下載檔名；裁判字號與案由相同的不同判決不會寫入同一個檔案"""
+    return hashlib.sha1(judgment_key(url).encode("utf-8")).hexdigest() + ".pdf"
+
+
+def copy_file(source, target, link=False):
+    """複製檔案；link 為 True 時在同一檔案系統上優先建立硬連結以省下空間
+
+    硬連結與快取存放區共用同一份內容，只能用於程式內部的暫存與工作檔；交給
+    使用者的輸出檔必須是獨立的複本，否則修改輸出檔會連帶改動快取。
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    if link:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+
+
+_judgment_cache = None
+_judgment_cache_lock = threading.Lock()
+
+
+def get_judgment_cache():
+    """取得行程共用的快取實例（第一次使用時才建立資料夾與資料庫）"""
+    global _judgment_cache
+    with _judgment_cache_lock:
+        if _judgment_cache is None:
+            _judgment_cache = JudgmentCache()
+        return _judgment_cache
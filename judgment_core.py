@@ -0,0 +1,1328 @@
+"""裁判書查詢與下載的核心邏輯（不依賴 Streamlit，可供網頁介面與命令列共用）
+
+模組匯入時不做任何 I/O，httpx、BeautifulSoup 與 Playwright 等較重的套件也只在
+實際使用時才載入。
+"""
+import asyncio
+import datetime
+import importlib.util
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager, AsyncExitStack
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from browser_service import LEASE_TIMEOUT, browser_service
+from fulltext_index import get_fulltext_index
+from judgment_cache import get_judgment_cache, judgment_key, copy_file, pdf_storage_name
+from metrics import get_metrics
+from request_scheduler import check_status, get_scheduler, is_timeout
+
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+UA_LIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ua_list.txt")
+
+@lru_cache(maxsize=None)
+def load_user_agents(path=UA_LIST_PATH):
+    """讀取 User-Agent 清單（首次使用時才讀檔）"""
+    with open(path, 'r') as f:
+        return [ua.strip() for ua in f.readlines() if ua.strip()]
+
+def random_user_agent():
+    """隨機挑選一個 User-Agent"""
+    return random.choice(load_user_agents())
+
+def print_status(message):
+    """預設的狀態回報：寫到 stderr，stdout 留給呼叫端的輸出（例如命令列的檔案路徑）"""
+    print(message, file=sys.stderr, flush=True)
+
+def make_soup(html, parser=None):
+    """以 BeautifulSoup 解析 HTML"""
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(html, parser or HTML_PARSER)
+
+# 可以 FJUD_SITE_ROOT 指向其他伺服器（例如 benchmarks/fake_fjud.py 的本機模擬站台）
+SITE_ROOT = os.environ.get("FJUD_SITE_ROOT", "https://judgment.judicial.gov.tw").rstrip("/")
+FJUD_BASE_URL = SITE_ROOT + "/FJUD/"
+
+# 同時開啟的詳細頁分頁數量上限
+DETAIL_CONCURRENCY = 5
+
+# 司法院系統每次查詢最多顯示 500 筆（25 頁，每頁 20 筆）
+RESULT_CAP = 500
+MAX_RESULT_PAGES = 25
+LIST_PAGE_SIZE = 20
+# 查詢結果頁面顯示查無資料的文字
+NO_RESULT_RE = re.compile(r"查無資料|無符合條件")
+
+# 分割查詢時同時執行的子查詢數量，以及子查詢總數上限
+PARTITION_CONCURRENCY = 3
+MAX_PARTITIONS = 256
+
+# 進階查詢頁面（可限制裁判日期，日期以民國年月日分欄輸入）
+ADVANCED_SEARCH_URL = FJUD_BASE_URL + "Default_AD.aspx"
+ADVANCED_FORM = {
+    "keyword": "#jud_kw",
+    "date_from": ("#dy1", "#dm1", "#dd1"),
+    "date_to": ("#dy2", "#dm2", "#dd2"),
+    "submit": "#btnQry",
+}
+
+# 詳細資訊尚未載入時顯示的文字
+PENDING_TEXT = "載入中..."
+
+# 等待頁面就緒的時間上限（毫秒），實際上一就緒就會繼續
+WAIT_TIMEOUT = 20000
+
+# 送出查詢前先標記目前的文件，之後只接受新載入的文件
+MARK_STALE_JS = """() => {
+    document.__fjudStale = true;
+    for (const f of document.querySelectorAll('iframe')) {
+        try { if (f.contentDocument) f.contentDocument.__fjudStale = true; } catch (e) {}
+    }
+}"""
+
+# 查詢結果已出現：新文件中有判決標題，或結果框架已載入完成（可能查無資料）
+SEARCH_READY_JS = """() => {
+    const hasTitles = d => d.querySelector("a[id*='hlTitle']") !== null;
+    if (!document.__fjudStale && hasTitles(document)) return true;
+    for (const f of document.querySelectorAll('iframe')) {
+        let d = null;
+        try { d = f.contentDocument; } catch (e) {}
+        if (!d || d.__fjudStale || d.location.href === 'about:blank') continue;
+        if (hasTitles(d)) return true;
+        if (f.id === 'iframe-data' && d.readyState === 'complete') return true;
+    }
+    return false;
+}"""
+
+TITLES_CHANGED_JS = """prev => {
+    const titles = Array.from(document.querySelectorAll("a[id*='hlTitle']")).map(el => el.textContent);
+    return titles.length > 0 && JSON.stringify(titles) !== JSON.stringify(prev);
+}"""
+
+# 一次取回裁判書頁面的標示欄位、全文與 PDF 連結，避免逐列往返瀏覽器
+EXTRACT_FIELDS_JS = """fields => {
+    const result = {case_text: null, pdf_href: null};
+    for (const row of document.querySelectorAll('.row')) {
+        const text = row.innerText;
+        const match = fields.find(([label]) => text.includes(label));
+        if (!match) continue;
+        const col = row.querySelector('.col-td');
+        if (col) result[match[1]] = col.innerText.trim();
+    }
+    const content = document.querySelector('.htmlcontent');
+    if (content) result.case_text = content.innerText.trim();
+    const link = document.querySelector('#hlExportPDF');
+    if (link) result.pdf_href = link.getAttribute('href');
+    return result;
+}"""
+
+# 瀏覽器只需要讀取 DOM 文字與連結，預設攔截圖片、樣式、字型等資源以節省頻寬與記憶體；
+# 設定 FJUD_BLOCK_RESOURCES=0 可關閉以便除錯
+BLOCK_RESOURCES = os.environ.get("FJUD_BLOCK_RESOURCES", "1") != "0"
+BLOCKED_RESOURCE_TYPES = frozenset(
+    os.environ.get("FJUD_BLOCKED_RESOURCE_TYPES", "image,stylesheet,font,media,texttrack,manifest").split(",")
+)
+# 一律攔截的第三方主機（流量分析與廣告），以及無論資源類型都放行的主機
+BLOCKED_HOSTS = ("google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net", "facebook.com")
+ALLOWED_HOSTS = ()
+
+# 優先以純 HTTP 抓取並解析裁判書頁面，解析失敗時才改用瀏覽器
+USE_HTTP_FAST_PATH = True
+HTTP_TIMEOUT = 30
+HTTP_MAX_CONNECTIONS = 20
+# 安裝 h2 時使用 HTTP/2，同一條連線即可多工處理所有請求
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+# 共用 HTTP 工作階段每隔多久（秒）重新從瀏覽器同步 cookie；cookie 到期時也會立即同步
+COOKIE_SYNC_INTERVAL = 300
+
+# 同時下載的 PDF 數量上限與串流寫入的區塊大小
+PDF_CONCURRENCY = 5
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+DETAIL_FIELDS = (
+    ("裁判字號：", "case_number"),
+    ("裁判日期：", "case_date"),
+    ("裁判案由：", "case_reason"),
+)
+
+BLOCK_TAGS = ["div", "p", "pre", "tr", "li", "table", "h1", "h2", "h3", "h4", "h5", "h6"]
+
+def full_judgment_url(url):
+    """將結果清單中的相對連結轉為完整網址"""
+    return url if url.startswith("http") else FJUD_BASE_URL + url
+
+def full_pdf_url(href):
+    """將 PDF 匯出連結轉為完整網址"""
+    if not href:
+        return None
+    if href.startswith("/"):
+        return SITE_ROOT + href
+    if not href.startswith("http"):
+        return FJUD_BASE_URL + href
+    return href
+
+def create_http_client(max_connections=HTTP_MAX_CONNECTIONS, user_agent=None):
+    """建立共用的非同步 HTTP 用戶端（保持連線並重複使用）"""
+    import httpx
+
+    return httpx.AsyncClient(
+        headers={"User-Agent": user_agent or random_user_agent()},
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        ),
+        http2=HTTP2_ENABLED,
+        follow_redirects=True
+    )
+
+class HttpSession:
+    """與瀏覽器上下文共用 cookie 與 User-Agent 的 HTTP 工作階段
+
+    PDF 下載、裁判書頁面與清單頁等不需要渲染的請求都經由同一個連線池送出，
+    伺服器看到的是與瀏覽器相同的工作階段。cookie 在第一次使用、超過
+    COOKIE_SYNC_INTERVAL 或其中任何一個到期時，重新從瀏覽器上下文同步。
+    """
+
+    def __init__(self, context, user_agent, max_connections=HTTP_MAX_CONNECTIONS):
+        self.context = context
+        self.user_agent = user_agent
+        self.max_connections = max_connections
+        self._client = None
+        self._synced = 0.0
+        self._expires = None
+        self._lock = asyncio.Lock()
+
+    def _stale(self):
+        now = time.time()
+        return now - self._synced > COOKIE_SYNC_INTERVAL or (self._expires is not None and now >= self._expires)
+
+    async def _sync_cookies(self):
+        cookies = await self.context.cookies()
+        for cookie in cookies:
+            self._client.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+        # expires 為 -1 的是工作階段 cookie，不會到期
+        expiries = [cookie["expires"] for cookie in cookies if cookie.get("expires", -1) > 0]
+        self._expires = min(expiries) if expiries else None
+        self._synced = time.time()
+
+    async def client(self, refresh=False):
+        """取得 HTTP 用戶端；refresh 為 True 時先同步瀏覽器目前的 cookie"""
+        async with self._lock:
+            if self._client is None:
+                self._client = create_http_client(self.max_connections, self.user_agent)
+                refresh = True
+            if refresh or self._stale():
+                await self._sync_cookies()
+            return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# 各瀏覽器上下文的共用 HTTP 工作階段（以 id(context) 為鍵，上下文結束時移除）
+_http_sessions = {}
+
+async def refresh_session(context):
+    """送出查詢後，把瀏覽器剛建立的工作階段 cookie 同步到共用 HTTP 工作階段"""
+    session = _http_sessions.get(id(context)) if context is not None else None
+    if session is not None:
+        await session.client(refresh=True)
+
+@asynccontextmanager
+async def session_client(context, refresh=False):
+    """取得瀏覽器上下文共用的 HTTP 用戶端；上下文沒有共用工作階段時建立臨時用戶端"""
+    session = _http_sessions.get(id(context)) if context is not None else None
+    if session is not None:
+        yield await session.client(refresh)
+        return
+    async with create_http_client() as client:
+        yield client
+
+async def stream_to_file(client, url, file_path):
+    """以串流方式下載檔案並分段寫入磁碟，成功回傳 None，失敗回傳錯誤訊息"""
+    # 先寫入暫存檔再改名，避免留下下載到一半的檔案
+    folder = os.path.dirname(file_path) or "."
+    fd, part_path = tempfile.mkstemp(dir=folder, suffix=".part")
+    os.close(fd)
+    
+    metrics = get_metrics()
+    
+    async def attempt(timeout):
+        # 每次重試都從頭寫入暫存檔
+        write_time = 0.0
+        try:
+            with open(part_path, "wb") as f:
+                async with client.stream("GET", url, timeout=timeout) as response:
+                    check_status(response.status_code, response.headers)
+                    if response.status_code != 200:
+                        return f"PDF下載失敗，狀態碼: {response.status_code}"
+                    first_chunk = True
+                    received = 0
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        # 過期的連結常回傳 200 的錯誤網頁，檢查檔頭以免存成壞檔
+                        if first_chunk and not chunk.startswith(b"%PDF"):
+                            return "下載內容不是PDF檔案"
+                        first_chunk = False
+                        received += len(chunk)
+                        write_start = time.perf_counter()
+                        f.write(chunk)
+                        write_time += time.perf_counter() - write_start
+                    # 連線中斷時可能只收到部分內容，與 Content-Length 比對
+                    expected = response.headers.get("Content-Length")
+                    if expected and expected.isdigit() and "Content-Encoding" not in response.headers and received != int(expected):
+                        return f"PDF下載不完整（{received}/{expected} bytes）"
+            return None
+        finally:
+            metrics.record("disk_write", write_time)
+    
+    try:
+        start = time.perf_counter()
+        try:
+            error = await get_scheduler().run("PDF 下載", url, attempt, HTTP_TIMEOUT)
+        except Exception:
+            metrics.record("pdf_fetch", time.perf_counter() - start, error=True)
+            raise
+        metrics.record("pdf_fetch", time.perf_counter() - start, error=error is not None)
+        if error:
+            return error
+        os.replace(part_path, file_path)
+        return None
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def element_text(element):
+    """近似瀏覽器 innerText 的文字擷取（區塊元素與 <br> 轉為換行）"""
+    for br in element.find_all("br"):
+        br.replace_with("\n")
+    for block in element.find_all(BLOCK_TAGS):
+        block.insert_before("\n")
+        block.insert_after("\n")
+    text = element.get_text().replace("\xa0", " ")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{2,}", "\n", text).strip()
+
+def parse_judgment_html(html):
+    """從裁判書頁面 HTML 解析詳細資訊，格式不符時回傳 None"""
+    soup = make_soup(html)
+    rows = soup.select(".row")
+    if not rows:
+        return None
+
+    details = {
+        "case_number": "未找到裁判字號",
+        "case_date": "未找到裁判日期",
+        "case_reason": "未找到案由",
+        "case_text": "未找到裁判全文",
+        "pdf_url": None
+    }
+    found_number = False
+    for row in rows:
+        text = row.get_text()
+        for label, key in DETAIL_FIELDS:
+            if label in text:
+                col = row.select_one(".col-td")
+                if col:
+                    details[key] = col.get_text().strip()
+                    found_number = found_number or key == "case_number"
+                break
+
+    # 連裁判字號都沒有，多半是錯誤頁或驗證頁，交由瀏覽器處理
+    if not found_number:
+        return None
+
+    content = soup.select_one(".htmlcontent")
+    if content:
+        details["case_text"] = element_text(content)
+
+    pdf_link = soup.select_one("#hlExportPDF")
+    if pdf_link:
+        details["pdf_url"] = full_pdf_url(pdf_link.get("href"))
+
+    return details
+
+async def fetch_judgment_details_http(client, url):
+    """以 HTTP 直接抓取並解析裁判書頁面，失敗時回傳 None 以便改用瀏覽器"""
+    full_url = full_judgment_url(url)
+    
+    async def attempt(timeout):
+        response = await client.get(full_url, timeout=timeout)
+        check_status(response.status_code, response.headers)
+        return response
+    
+    try:
+        with get_metrics().timer("detail_http_fetch"):
+            response = await get_scheduler().run("裁判書頁面 (HTTP)", full_url, attempt, HTTP_TIMEOUT)
+        if response.status_code != 200:
+            return None
+        with get_metrics().timer("field_extraction"):
+            return parse_judgment_html(response.text)
+    except Exception as e:
+        print(f"HTTP 獲取裁判詳細資訊失敗，改用瀏覽器: {e}", file=sys.stderr)
+        return None
+
+def host_matches(host, domains):
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+def should_block(resource_type, url, blocked_types=BLOCKED_RESOURCE_TYPES,
+                 blocked_hosts=BLOCKED_HOSTS, allowed_hosts=ALLOWED_HOSTS):
+    """判斷瀏覽器的請求是否應該攔截"""
+    host = urlsplit(url).hostname or ""
+    if host_matches(host, allowed_hosts):
+        return False
+    return resource_type in blocked_types or host_matches(host, blocked_hosts)
+
+async def block_resources(context, blocked_types=BLOCKED_RESOURCE_TYPES,
+                          blocked_hosts=BLOCKED_HOSTS, allowed_hosts=ALLOWED_HOSTS):
+    """在瀏覽器上下文上攔截不需要的資源（對 context.request 發出的請求沒有影響）"""
+    async def handle(route):
+        request = route.request
+        if should_block(request.resource_type, request.url, blocked_types, blocked_hosts, allowed_hosts):
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    await context.route("**/*", handle)
+
+@asynccontextmanager
+async def get_browser_context(block=None, lease_timeout=LEASE_TIMEOUT, on_wait=None):
+    """瀏覽器上下文管理器（向行程共用的瀏覽器服務租用上下文）
+
+    block 未指定時依 BLOCK_RESOURCES 決定是否攔截非必要資源。名額已滿時最多等待
+    lease_timeout 秒，on_wait 接收等待訊息（取得後為 None），逾時拋出 BrowserBusyError。
+    """
+    ua = random_user_agent()
+    start = time.perf_counter()
+    async with browser_service.context(
+        lease_timeout=lease_timeout,
+        on_wait=on_wait,
+        viewport={"width": 1280, "height": 800},
+        user_agent=ua
+    ) as context:
+        if BLOCK_RESOURCES if block is None else block:
+            await block_resources(context)
+        get_metrics().record("browser_launch", time.perf_counter() - start)
+        session = HttpSession(context, ua)
+        _http_sessions[id(context)] = session
+        try:
+            yield context
+        finally:
+            _http_sessions.pop(id(context), None)
+            await session.aclose()
+
+class LazyBrowserContext:
+    """首次需要時才租用瀏覽器上下文，只切換分頁的重新執行不會碰到瀏覽器"""
+
+    def __init__(self, block=None, on_wait=None):
+        self._stack = AsyncExitStack()
+        self._context = None
+        self._block = block
+        self._on_wait = on_wait
+
+    async def get(self, lease_timeout=LEASE_TIMEOUT):
+        """取得瀏覽器上下文，第一次呼叫時才租用（名額已滿時最多等待 lease_timeout 秒）"""
+        if self._context is None:
+            self._context = await self._stack.enter_async_context(
+                get_browser_context(self._block, lease_timeout, self._on_wait)
+            )
+        return self._context
+
+    async def release(self):
+        """提早歸還租用的上下文，之後再呼叫 get() 會重新租用"""
+        await self._stack.aclose()
+        self._stack = AsyncExitStack()
+        self._context = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._stack.aclose()
+
+async def goto_page(page, url, stage, default_timeout=30, metric="detail_navigation"):
+    """透過請求排程器開啟頁面，逾時或暫時性錯誤時退避重試"""
+    async def attempt(timeout):
+        response = await page.goto(url, timeout=timeout * 1000)
+        if response is not None:
+            check_status(response.status, response.headers)
+        return response
+    
+    with get_metrics().timer(metric):
+        return await get_scheduler().run(stage, url, attempt, default_timeout)
+
+def adaptive_wait_timeout(label, wait_timeout):
+    """依近期實際等待時間調整頁面等待的逾時（毫秒）"""
+    return get_scheduler().timeout(label, wait_timeout / 1000) * 1000
+
+async def get_judgment_details(context, url, page=None, client=None, page_pool=None):
+    """獲取裁判詳細資訊（字號、日期、案由和裁判全文）"""
+    cached = get_judgment_cache().get_details(url)
+    if cached:
+        get_fulltext_index().add(url, cached)
+        return cached
+
+    details = None
+    if client is not None and USE_HTTP_FAST_PATH:
+        details = await fetch_judgment_details_http(client, url)
+    if details is None:
+        details = await read_details_from_page(context, url, page, page_pool)
+
+    # 只快取完整取得的結果，失敗或不完整的下次仍會重新抓取
+    if details["case_number"] not in ("獲取失敗", "未找到裁判字號"):
+        get_judgment_cache().put_details(url, details)
+        get_fulltext_index().add(url, details)
+    return details
+
+async def extract_page_fields(page):
+    """以單次 page.evaluate 讀取裁判書頁面的各欄位、全文與 PDF 連結
+
+    回傳的字典包含 DETAIL_FIELDS 中找到的欄位、case_text 與 pdf_url，找不到的
+    欄位不會出現（全文與連結則為 None）。
+    """
+    with get_metrics().timer("field_extraction"):
+        fields = await page.evaluate(EXTRACT_FIELDS_JS, [list(field) for field in DETAIL_FIELDS])
+    fields["pdf_url"] = full_pdf_url(fields.pop("pdf_href"))
+    return fields
+
+async def read_details_from_page(context, url, page=None, page_pool=None):
+    """以瀏覽器開啟裁判書頁面並讀取詳細資訊"""
+    # 若由呼叫端提供分頁或分頁池，則沿用其分頁且不在此關閉
+    own_page = page is None and page_pool is None
+    try:
+        if page_pool is not None and page is None:
+            page = await page_pool.acquire()
+        elif own_page:
+            page = await context.new_page()
+        full_url = full_judgment_url(url)
+        
+        await goto_page(page, full_url, "裁判書頁面")
+        with get_metrics().timer("selector_wait"):
+            await page.wait_for_selector(".row", timeout=20000)
+        
+        fields = await extract_page_fields(page)
+        return {
+            "case_number": fields.get("case_number") or "未找到裁判字號",
+            "case_date": fields.get("case_date") or "未找到裁判日期",
+            "case_reason": fields.get("case_reason") or "未找到案由",
+            "case_text": fields["case_text"] or "未找到裁判全文",
+            "pdf_url": fields["pdf_url"]
+        }
+    except Exception as e:
+        print(f"獲取裁判詳細資訊失敗: {e}", file=sys.stderr)
+        return failed_details()
+    finally:
+        if page_pool is not None and page is not None:
+            page_pool.release(page)
+        elif own_page and page:
+            await page.close()
+
+def failed_details():
+    """獲取失敗時使用的裁判詳細資訊"""
+    return {
+        "case_number": "獲取失敗",
+        "case_date": "獲取失敗",
+        "case_reason": "獲取失敗",
+        "case_text": "獲取失敗",
+        "pdf_url": None
+    }
+
+class PagePool:
+    """有上限的 Playwright 分頁池，供並行獲取裁判詳細資訊使用"""
+
+    def __init__(self, context, size):
+        self.context = context
+        self._slots = asyncio.Semaphore(max(1, size))
+        self._idle = []
+        self._pages = []
+
+    async def acquire(self):
+        """取得一個可用分頁，閒置分頁不足且未達上限時才開新分頁"""
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop()
+        try:
+            page = await self.context.new_page()
+        except Exception:
+            self._slots.release()
+            raise
+        self._pages.append(page)
+        return page
+
+    def release(self, page):
+        """歸還分頁；已關閉或崩潰的分頁直接捨棄，下次取用時再開新分頁"""
+        if page.is_closed():
+            self._pages.remove(page)
+        else:
+            self._idle.append(page)
+        self._slots.release()
+
+    async def close(self):
+        """關閉分頁池中所有分頁"""
+        for page in self._pages:
+            try:
+                if not page.is_closed():
+                    await page.close()
+            except Exception:
+                pass
+        self._pages = []
+
+async def fetch_details_batch(context, urls, concurrency=DETAIL_CONCURRENCY, client=None):
+    """以分頁池並行獲取多筆裁判詳細資訊，結果順序與輸入相同"""
+    if not urls:
+        return []
+
+    # 分頁只在快取未命中且 HTTP 快速路徑失敗時才會開啟
+    pool = PagePool(context, min(concurrency, len(urls)))
+    slots = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(url):
+        async with slots:
+            return await get_judgment_details(context, url, client=client, page_pool=pool)
+
+    try:
+        results = await asyncio.gather(*(fetch_one(url) for url in urls), return_exceptions=True)
+    finally:
+        await pool.close()
+
+    details = []
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            print(f"獲取裁判詳細資訊失敗 ({url}): {result}", file=sys.stderr)
+            result = failed_details()
+        details.append(result)
+    return details
+
+async def read_judgment_links(container):
+    """讀取結果清單中的判決標題與連結"""
+    links = []
+    for el in await container.query_selector_all("a[id*='hlTitle']"):
+        links.append({
+            "title": await el.inner_text(),
+            "url": await el.get_attribute("href")
+        })
+    return links
+
+def judgment_from_details(link, details):
+    """由結果清單連結與裁判詳細資訊組成一筆判決資料"""
+    return {
+        "title": link["title"],
+        "url": link["url"],
+        "case_number": details["case_number"],
+        "case_date": details["case_date"],
+        "case_reason": details["case_reason"],
+        "case_text": details["case_text"],
+        "pdf_url": details["pdf_url"],
+        "file_name": pdf_file_name(details["case_number"], details["case_reason"]) if details["pdf_url"] else None,
+        "details_loaded": True
+    }
+
+def pending_judgment(link):
+    """尚未載入詳細資訊的判決資料，先以清單標題顯示"""
+    return {
+        "title": link["title"],
+        "url": link["url"],
+        "case_number": link["title"].strip(),
+        "case_date": PENDING_TEXT,
+        "case_reason": PENDING_TEXT,
+        "case_text": PENDING_TEXT,
+        "pdf_url": None,
+        "file_name": None,
+        "details_loaded": False
+    }
+
+async def fetch_link_details(context, links, concurrency=DETAIL_CONCURRENCY, client=None):
+    """為結果清單中的連結補上裁判詳細資訊"""
+    if concurrency > 1:
+        details_list = await fetch_details_batch(context, [link["url"] for link in links], concurrency, client)
+    else:
+        details_list = [await get_judgment_details(context, link["url"], client=client) for link in links]
+
+    return [judgment_from_details(link, details) for link, details in zip(links, details_list)]
+
+def pending_details(judgments):
+    """找出尚未載入詳細資訊的判決"""
+    return [judgment for judgment in judgments if not judgment.get("details_loaded", True)]
+
+async def ensure_details(context, judgments, concurrency=DETAIL_CONCURRENCY):
+    """為尚未載入詳細資訊的判決補上內容（就地更新），回傳本次載入的筆數"""
+    pending = pending_details(judgments)
+    if not pending:
+        return 0
+    
+    async with session_client(context) as client:
+        loaded = await fetch_link_details(context, pending, concurrency, client)
+    for judgment, loaded_judgment in zip(pending, loaded):
+        judgment.update(loaded_judgment)
+    return len(pending)
+
+async def timed_wait(label, awaitable, timings, stage=None, metric="selector_wait"):
+    """等待頁面就緒並記錄實際花費的時間（秒），等待時間也提供給排程器調整逾時
+
+    逾時的等待同樣記錄（以放大的逾時秒數計），下次的逾時才會跟著拉長。
+    """
+    start = time.perf_counter()
+    error = True
+    try:
+        result = await awaitable
+        get_scheduler().latency.record(stage or label, time.perf_counter() - start)
+        error = False
+        return result
+    except Exception as e:
+        if is_timeout(e):
+            get_scheduler().latency.record_timeout(stage or label, time.perf_counter() - start)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        get_metrics().record(metric, elapsed, error)
+        timings.append((label, elapsed))
+
+async def submit_search(page, keyword, date_range=None, wait_timeout=WAIT_TIMEOUT, wait_timings=None, on_status=print_status):
+    """開啟查詢頁並送出關鍵字查詢，回傳結果清單所在的框架（找不到時回傳 None）
+
+    date_range 為 (起日, 迄日) 的 datetime.date，指定時改用進階查詢頁面限制裁判日期。
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    if wait_timings is None:
+        wait_timings = []
+    
+    if date_range is None:
+        on_status("正在連接法院判決網站...")
+        await goto_page(page, FJUD_BASE_URL + "default.aspx", "查詢頁面", 60, "page_navigation")
+        
+        on_status(f"輸入搜尋關鍵字: {keyword}")
+        await page.fill("#txtKW", keyword)
+        submit_selector = "#btnSimpleQry"
+    else:
+        await goto_page(page, ADVANCED_SEARCH_URL, "查詢頁面", 60, "page_navigation")
+        await page.fill(ADVANCED_FORM["keyword"], keyword)
+        for selectors, day in ((ADVANCED_FORM["date_from"], date_range[0]), (ADVANCED_FORM["date_to"], date_range[1])):
+            for selector, value in zip(selectors, roc_date_parts(day)):
+                await page.fill(selector, value)
+        submit_selector = ADVANCED_FORM["submit"]
+    
+    on_status("送出查詢，請稍候...")
+    await page.evaluate(MARK_STALE_JS)
+    await page.click(submit_selector)
+    
+    try:
+        await timed_wait("查詢結果載入", page.wait_for_function(SEARCH_READY_JS, timeout=adaptive_wait_timeout("查詢結果載入", wait_timeout)), wait_timings, metric="search_submit")
+    except PlaywrightTimeoutError:
+        on_status("等待查詢結果逾時，嘗試繼續處理...")
+    
+    frame_start = time.perf_counter()
+    frame = None
+    iframe = await page.query_selector("#iframe-data")
+    if iframe:
+        frame = page.frame(name="iframe-data") or page.frame(id="iframe-data")
+    
+    if not frame:
+        for f in page.frames:
+            if "FJUD/data.aspx" in f.url:
+                frame = f
+                break
+    
+    if not frame:
+        frame_locator = page.frame_locator("iframe").first
+        if await frame_locator.count() > 0:
+            frame = await frame_locator.frame()
+    
+    get_metrics().record("frame_discovery", time.perf_counter() - frame_start, error=frame is None)
+    return frame
+
+async def click_through_list_pages(page, frame, max_pages, wait_timeout=WAIT_TIMEOUT, wait_timings=None, on_status=print_status, stop=None):
+    """逐頁點擊「下一頁」讀取結果清單，回傳每頁的連結清單
+
+    stop(links) 回傳 True 時讀完該頁即停止換頁。
+    """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    if wait_timings is None:
+        wait_timings = []
+    
+    list_pages = []
+    current_page = 1
+    
+    while current_page <= max_pages:
+        links = await read_judgment_links(frame)
+        # 換頁失敗時可能重複讀到同一頁
+        if not list_pages or links != list_pages[-1]:
+            list_pages.append(links)
+        on_status(f"已讀取第 {current_page} 頁清單（{len(links)} 筆）")
+        if stop and stop(links):
+            break
+        
+        if current_page < max_pages:
+            try:
+                next_link = await frame.query_selector("a#hlNext")
+                if next_link:
+                    current_titles = await frame.eval_on_selector_all("a[id*='hlTitle']", "els => els.map(el => el.textContent)")
+                    
+                    await next_link.click()
+                    on_status(f"正在切換到第 {current_page + 1} 頁...")
+                    
+                    # 等到清單標題與換頁前不同才算載入完成
+                    try:
+                        await timed_wait(
+                            f"第 {current_page + 1} 頁載入",
+                            frame.wait_for_function(
+                                TITLES_CHANGED_JS, arg=current_titles,
+                                timeout=adaptive_wait_timeout("換頁載入", wait_timeout)
+                            ),
+                            wait_timings,
+                            stage="換頁載入",
+                            metric="list_page_load"
+                        )
+                    except PlaywrightTimeoutError:
+                        on_status("頁面可能未正確變化，繼續處理...")
+                else:
+                    on_status("已到最後一頁")
+                    break
+            except Exception as e:
+                on_status(f"切換頁面時發生錯誤: {e}")
+                try:
+                    for f in page.frames:
+                        if "FJUD/data.aspx" in f.url:
+                            frame = f
+                            break
+                    await timed_wait("重新載入清單", frame.wait_for_selector("a[id*='hlTitle']", timeout=adaptive_wait_timeout("重新載入清單", wait_timeout)), wait_timings, metric="list_page_load")
+                    continue
+                except:
+                    break
+        
+        current_page += 1
+    
+    return list_pages
+
+async def read_list_pages(context, page, frame, max_pages, concurrency=DETAIL_CONCURRENCY, wait_timeout=WAIT_TIMEOUT, wait_timings=None, on_status=print_status, stop=None):
+    """讀取前 max_pages 頁結果清單：優先直接並行請求，失敗時改回逐頁點擊「下一頁」
+
+    指定 stop 時改為逐頁讀取，stop(links) 回傳 True 後不再讀取後面的頁面。
+    """
+    try:
+        direct_pages = await fetch_list_pages_direct(context, frame, max_pages, concurrency, stop)
+    except Exception as e:
+        on_status(f"直接請求清單頁失敗，改用逐頁點擊: {e}")
+        direct_pages = None
+    if direct_pages:
+        return direct_pages
+    return await click_through_list_pages(page, frame, max_pages, wait_timeout, wait_timings, on_status, stop)
+
+async def fetch_judgments(context, keyword, max_pages=25, concurrency=DETAIL_CONCURRENCY, wait_timeout=WAIT_TIMEOUT, wait_timings=None, lazy=False, on_status=print_status, on_progress=None, stop=None, raise_errors=False):
+    """非同步獲取裁判書資料
+
+    wait_timings 會記錄每次等待頁面的實際時間；lazy 為 True 時只回傳清單標題與連結，
+    詳細資訊之後再以 ensure_details 載入。on_status / on_progress 接收狀態文字與
+    0~1 的進度，供介面或命令列顯示。stop(links) 回傳 True 時不再讀取後面的清單頁。
+    查詢失敗時預設回傳空清單；raise_errors 為 True 時改為拋出例外，讓呼叫端能
+    區分「查無資料」與「查詢失敗」。
+    """
+    if wait_timings is None:
+        wait_timings = []
+    on_progress = on_progress or (lambda fraction: None)
+    
+    async def collect(links):
+        if lazy:
+            return [pending_judgment(link) for link in links]
+        return await fetch_link_details(context, links, concurrency, client)
+    
+    on_status("正在準備查詢...")
+    
+    page = None
+    client_scope = AsyncExitStack()
+    try:
+        client = await client_scope.enter_async_context(session_client(context))
+        page = await context.new_page()
+        
+        frame = await submit_search(page, keyword, None, wait_timeout, wait_timings, on_status)
+        # 之後的詳細資訊與 PDF 請求都要帶著查詢建立的工作階段
+        await refresh_session(context)
+        
+        if not frame:
+            on_status("尋找判決清單框架...")
+            judgment_links = await read_judgment_links(page)
+            if len(judgment_links) > 0:
+                judgment_urls = await collect(judgment_links)
+                on_progress(1.0)
+                on_status(f"找到 {len(judgment_urls)} 筆判決")
+                return judgment_urls, 1
+            else:
+                on_progress(1.0)
+                on_status("未找到任何判決")
+                return [], 0
+        
+        on_status("等待判決清單載入...")
+        await timed_wait("判決清單載入", frame.wait_for_selector("a[id*='hlTitle']", timeout=adaptive_wait_timeout("判決清單載入", wait_timeout)), wait_timings, metric="list_page_load")
+        
+        list_pages = await read_list_pages(context, page, frame, max_pages, concurrency, wait_timeout, wait_timings, on_status, stop)
+        
+        all_judgments = []
+        last_page = len(list_pages)
+        for current_page, links in enumerate(list_pages, 1):
+            on_status(f"正在獲取第 {current_page} 頁的 {len(links)} 筆判決內容...")
+            page_judgments = await collect(links)
+            all_judgments.extend(page_judgments)
+            on_progress(current_page / last_page)
+            on_status(f"進度: {current_page}/{last_page} 頁 | 當前頁: {len(page_judgments)}筆 | 總計: {len(all_judgments)}筆")
+        
+        total_pages = await get_total_pages(frame)
+        
+        on_progress(1.0)
+        on_status(f"完成查詢！（等待頁面載入共 {sum(t for _, t in wait_timings):.1f} 秒）")
+        
+        return all_judgments, total_pages
+        
+    except Exception as e:
+        on_progress(1.0)
+        on_status(f"查詢過程中發生錯誤: {e}")
+        if raise_errors:
+            raise
+        return [], 0
+    finally:
+        if page:
+            await page.close()
+        await client_scope.aclose()
+
+def roc_date_parts(day):
+    """將日期轉為民國年、月、日字串"""
+    return str(day.year - 1911), str(day.month), str(day.day)
+
+async def read_result_count(page, frame):
+    """讀取查詢結果總筆數（「共 N 筆」），頁面顯示查無資料時回傳 0，找不到時回傳 None"""
+    for target in (frame, page):
+        try:
+            text = await target.inner_text("body", timeout=5000)
+        except Exception:
+            continue
+        match = re.search(r"共\s*([\d,]+)\s*筆", text)
+        if match:
+            return int(match.group(1).replace(",", ""))
+        if NO_RESULT_RE.search(text):
+            return 0
+    return None
+
+async def search_partition(context, keyword, date_range, concurrency=DETAIL_CONCURRENCY, wait_timeout=WAIT_TIMEOUT, wait_timings=None, allow_capped=False):
+    """查詢單一日期區間，回傳 (連結清單, 結果筆數)
+
+    結果達到系統上限且 allow_capped 為 False 時不讀取清單，連結清單回傳 None，
+    由呼叫端再把日期區間切小。頁面顯示 0 筆（或查無資料）時立即回傳空清單；
+    否則等待判決清單逾時會拋出例外，不會被當成查無資料。
+    """
+    page = await context.new_page()
+    try:
+        frame = await submit_search(page, keyword, date_range, wait_timeout, wait_timings, on_status=lambda message: None)
+        await refresh_session(context)
+        if not frame:
+            links = await read_judgment_links(page)
+            return links, len(links)
+        
+        count = await read_result_count(page, frame)
+        if count == 0:
+            return [], 0
+        
+        await timed_wait(
+            "判決清單載入", frame.wait_for_selector("a[id*='hlTitle']", timeout=adaptive_wait_timeout("判決清單載入", wait_timeout)),
+            wait_timings if wait_timings is not None else [], metric="list_page_load"
+        )
+        
+        total_pages = await get_total_pages(frame)
+        if count is None:
+            count = RESULT_CAP if total_pages >= MAX_RESULT_PAGES else total_pages * LIST_PAGE_SIZE
+        
+        if count >= RESULT_CAP and not allow_capped:
+            return None, count
+        
+        list_pages = await read_list_pages(context, page, frame, MAX_RESULT_PAGES, concurrency, wait_timeout, wait_timings, on_status=lambda message: None)
+        return [link for links in list_pages for link in links], count
+    finally:
+        await page.close()
+
+async def fetch_judgments_partitioned(context, keyword, start_date, end_date, concurrency=DETAIL_CONCURRENCY, wait_timeout=WAIT_TIMEOUT, wait_timings=None, lazy=False, on_status=print_status, on_progress=None, on_warning=None):
+    """依裁判日期自動分割查詢，突破單一查詢 500 筆的上限
+
+    子查詢結果達上限時將日期區間對半切分再查，直到每個區間都低於上限（或只剩
+    單一日期）。各子查詢並行執行，合併時依判決網址去除重複。個別子查詢失敗時
+    仍合併其他區間的結果，失敗的日期區間以 on_warning 回報。
+    """
+    if wait_timings is None:
+        wait_timings = []
+    on_progress = on_progress or (lambda fraction: None)
+    on_warning = on_warning or on_status
+    
+    on_status("正在準備分割查詢...")
+    
+    if start_date > end_date:
+        start_date, end_date = end_date, start_date
+    
+    slots = asyncio.Semaphore(PARTITION_CONCURRENCY)
+    partitions = []
+    capped_ranges = []
+    failed_ranges = []
+    started = 0
+    finished = 0
+    
+    async def run_partition(date_range):
+        nonlocal started, finished
+        started += 1
+        # 只剩單一日期或子查詢數已達上限時不再切分，直接取前 500 筆
+        can_split = date_range[0] < date_range[1] and started + 2 <= MAX_PARTITIONS
+        try:
+            async with slots:
+                links, count = await search_partition(
+                    context, keyword, date_range, concurrency, wait_timeout, wait_timings, allow_capped=not can_split
+                )
+        except Exception as e:
+            finished += 1
+            failed_ranges.append(f"{date_range[0]} ~ {date_range[1]}")
+            on_status(f"{date_range[0]} ~ {date_range[1]} 查詢失敗: {e}")
+            return
+        finished += 1
+        
+        if links is None:
+            middle = date_range[0] + (date_range[1] - date_range[0]) // 2
+            on_status(f"{date_range[0]} ~ {date_range[1]} 共 {count} 筆，超過上限，切分日期區間...")
+            await asyncio.gather(
+                run_partition((date_range[0], middle)),
+                run_partition((middle + datetime.timedelta(days=1), date_range[1]))
+            )
+            return
+        
+        if count >= RESULT_CAP:
+            capped_ranges.append(f"{date_range[0]} ~ {date_range[1]}")
+        partitions.append((date_range, links))
+        on_progress(min(finished / max(started, 1), 0.99) * 0.5)
+        on_status(f"已完成 {finished} 個子查詢，目前共 {sum(len(l) for _, l in partitions)} 筆")
+    
+    client_scope = AsyncExitStack()
+    try:
+        client = await client_scope.enter_async_context(session_client(context))
+        await run_partition((start_date, end_date))
+        
+        # 依日期由新到舊合併，並以判決 JID 去除重複
+        merged_links = []
+        seen = set()
+        for _, links in sorted(partitions, key=lambda item: item[0][0], reverse=True):
+            for link in links:
+                key = judgment_key(full_judgment_url(link["url"]))
+                if key not in seen:
+                    seen.add(key)
+                    merged_links.append(link)
+        
+        if capped_ranges:
+            on_warning(f"以下日期區間無法再切分，結果仍達 {RESULT_CAP} 筆上限，只取得前 {RESULT_CAP} 筆: {', '.join(capped_ranges)}")
+        if failed_ranges:
+            on_warning(f"以下日期區間查詢失敗，結果不包含這些區間: {', '.join(failed_ranges)}")
+        
+        if lazy:
+            judgments = [pending_judgment(link) for link in merged_links]
+        else:
+            judgments = []
+            for start in range(0, len(merged_links), LIST_PAGE_SIZE):
+                judgments.extend(await fetch_link_details(context, merged_links[start:start + LIST_PAGE_SIZE], concurrency, client))
+                on_progress(0.5 + 0.5 * len(judgments) / len(merged_links))
+                on_status(f"正在獲取判決內容: {len(judgments)}/{len(merged_links)} 筆")
+        
+        on_progress(1.0)
+        if not capped_ranges and not failed_ranges:
+            on_status(f"完成分割查詢！共 {finished} 個子查詢，{len(judgments)} 筆判決")
+        total_pages = (len(judgments) + LIST_PAGE_SIZE - 1) // LIST_PAGE_SIZE
+        return judgments, total_pages
+    
+    except Exception as e:
+        on_progress(1.0)
+        on_status(f"分割查詢過程中發生錯誤: {e}")
+        return [], 0
+    finally:
+        await client_scope.aclose()
+
+def parse_list_page(html):
+    """從結果清單 HTML 解析判決連結，並回傳是否還有「下一頁」：(連結清單, 有無下一頁)"""
+    soup = make_soup(html)
+    links = []
+    for el in soup.select("a[id*='hlTitle']"):
+        href = el.get("href")
+        if href:
+            links.append({"title": el.get_text().strip(), "url": href})
+    return links, soup.select_one("a#hlNext") is not None
+
+def list_page_url(next_url, page_number):
+    """以「下一頁」連結為範本，組出第 N 頁清單的網址"""
+    parts = urlsplit(next_url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() != "page"]
+    query.append(("page", str(page_number)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+async def fetch_list_pages_direct(context, frame, max_pages, concurrency=DETAIL_CONCURRENCY, stop=None):
+    """第一頁載入後，直接並行請求其餘各頁清單
+
+    回傳每頁的連結清單（含第一頁）；無法直接請求時回傳 None，交由逐頁點擊處理。
+    指定 stop 或讀不到總頁數時改為逐頁請求，直到沒有「下一頁」、達到 max_pages
+    或 stop(links) 回傳 True 為止。
+    """
+    first_links = await read_judgment_links(frame)
+    if max_pages <= 1 or (stop and stop(first_links)):
+        return [first_links]
+    
+    next_link = await frame.query_selector("a#hlNext")
+    if not next_link:
+        return [first_links]
+    next_href = await next_link.get_attribute("href")
+    if not next_href or next_href.startswith("javascript"):
+        return None
+    next_url = urljoin(frame.url, next_href)
+    
+    total_pages = await read_total_pages(frame)
+    last_page = min(max_pages, total_pages or max_pages)
+    slots = asyncio.Semaphore(concurrency)
+    
+    async def fetch_page(page_number):
+        page_url = list_page_url(next_url, page_number)
+        
+        async def attempt(timeout):
+            response = await client.get(page_url, headers={"Referer": frame.url}, timeout=timeout)
+            check_status(response.status_code, response.headers)
+            if response.status_code != 200:
+                raise RuntimeError(f"第 {page_number} 頁清單狀態碼: {response.status_code}")
+            return parse_list_page(response.text)
+        
+        async with slots:
+            with get_metrics().timer("list_page_load"):
+                return await get_scheduler().run("清單頁 (HTTP)", page_url, attempt, WAIT_TIMEOUT / 1000)
+    
+    try:
+        # 查詢剛在瀏覽器中建立工作階段，先同步 cookie 再以共用連線請求清單頁
+        async with session_client(context, refresh=True) as client:
+            if stop or total_pages is None:
+                pages = []
+                for page_number in range(2, last_page + 1):
+                    links, has_next = await fetch_page(page_number)
+                    pages.append(links)
+                    if not has_next or (stop and stop(links)):
+                        break
+            else:
+                pages = [links for links, _ in await asyncio.gather(*(fetch_page(n) for n in range(2, last_page + 1)))]
+    except Exception as e:
+        print(f"直接請求清單頁失敗，改用逐頁點擊: {e}", file=sys.stderr)
+        return None
+    
+    # 伺服器若忽略頁碼參數會回傳重複的清單，此時也改用逐頁點擊
+    seen = {tuple(link["url"] for link in first_links)}
+    for links in pages:
+        key = tuple(link["url"] for link in links)
+        if not links or key in seen:
+            print("直接請求的清單頁內容異常，改用逐頁點擊", file=sys.stderr)
+            return None
+        seen.add(key)
+    
+    return [first_links] + pages
+
+async def get_total_pages(frame):
+    """獲取總頁數（讀不到頁碼資訊時至少為 2）"""
+    total_pages = await read_total_pages(frame)
+    return 2 if total_pages is None else total_pages
+
+async def read_total_pages(frame):
+    """讀取總頁數；有「下一頁」但讀不到頁碼資訊時回傳 None"""
+    try:
+        next_link = await frame.query_selector("a#hlNext")
+        if not next_link:
+            return 1
+        
+        try:
+            page_info = await frame.inner_text("#divPager", timeout=5000)
+            if "共" in page_info and "頁" in page_info:
+                parts = page_info.split("共")[1].split("頁")[0].strip()
+                return int(parts)
+        except:
+            pass
+        
+        try:
+            select_html = await frame.inner_html("#ddlPage", timeout=5000)
+            soup = make_soup(select_html, 'html.parser')
+            select = soup.find('select', {'id': 'ddlPage'})
+            
+            if select:
+                options = select.find_all('option')
+                return len(options)
+        except:
+            pass
+        
+        return None
+        
+    except Exception:
+        return 1
+
+def clean_filename(text):
+    """移除檔名中不安全的字元"""
+    keep_chars = (' ', '_', '-', '，', '。', '、', '：', '；', '？', '！', 
+                 '「', '」', '『', '』', '（', '）', '【', '】', '《', '》')
+    return "".join(c for c in text if c.isalnum() or c in keep_chars).strip()
+
+def pdf_file_name(case_number, case_reason):
+    """由裁判字號與案由組成 PDF 檔名"""
+    case_number_clean = clean_filename(case_number)
+    case_reason_clean = clean_filename(case_reason)
+    
+    safe_name = f"{case_number_clean}_{case_reason_clean}.pdf"
+    
+    if len(safe_name) > 200:
+        safe_name = f"{case_number_clean[:150]}_{case_reason_clean[:50]}.pdf"
+    return safe_name
+
+async def download_stored_pdf(judgment, download_folder, client):
+    """直接使用查詢時記錄的 PDF 連結下載，連結不存在或失效時回傳錯誤訊息
+
+    檔案以判決鍵命名（見 pdf_storage_name），原始檔名只在輸出時使用。
+    """
+    pdf_url = judgment.get("pdf_url")
+    file_name = judgment.get("file_name")
+    if not pdf_url or not file_name:
+        return None, "未記錄PDF下載連結"
+    
+    try:
+        file_path = os.path.join(download_folder, pdf_storage_name(judgment["url"]))
+        error = await stream_to_file(client, pdf_url, file_path)
+        if error:
+            return None, error
+        return file_path, None
+    except Exception as e:
+        return None, f"下載過程中發生錯誤: {e}"
+
+async def batch_download_pdfs(context, judgment_batch, download_folder, concurrency=PDF_CONCURRENCY, on_status=None, on_progress=None, on_result=None):
+    """批量下載一批判決書PDF，回傳 ([(檔案路徑, 原始檔名)], 錯誤訊息)
+
+    下載的檔案以判決鍵命名，原始檔名（裁判字號_案由.pdf）另外回傳，供建立壓縮檔
+    或複製到輸出資料夾時使用。on_result 在每筆判決處理完畢（成功或失敗）時以
+    (判決, 檔案路徑, 原始檔名, 錯誤訊息) 呼叫，並可回傳檔案的新路徑（例如已搬移
+    到其他位置時）。
+    """
+    total = len(judgment_batch)
+    results = [None] * total
+    completed = 0
+    slots = asyncio.Semaphore(concurrency)
+    downloading = {}
+    
+    async def download_one(i, judgment, client):
+        nonlocal completed
+        key = judgment_key(judgment["url"])
+        first = downloading.get(key)
+        if first is None:
+            downloading[key] = asyncio.Event()
+        else:
+            # 同一批中重複的判決等第一筆下載完成後，直接取用 PDF 快取
+            await first.wait()
+        try:
+            async with slots:
+                results[i] = await download_judgment_pdf(context, judgment["url"], download_folder, client, judgment)
+                if on_result:
+                    try:
+                        moved_path = on_result(judgment, *results[i])
+                        if moved_path:
+                            results[i] = (moved_path, results[i][1], None)
+                    except Exception as e:
+                        results[i] = (None, None, f"記錄下載進度失敗: {e}")
+        finally:
+            if first is None:
+                downloading[key].set()
+        
+        completed += 1
+        if on_status:
+            on_status(f"已完成 {completed}/{total} 個: {judgment['case_number']}")
+        if on_progress:
+            on_progress(completed / total)
+    
+    async with session_client(context) as client:
+        await asyncio.gather(*(download_one(i, judgment, client) for i, judgment in enumerate(judgment_batch)))
+    
+    downloaded_files = []
+    errors = []
+    for judgment, (file_path, file_name, error) in zip(judgment_batch, results):
+        if file_path:
+            downloaded_files.append((file_path, file_name))
+        else:
+            errors.append(f"{judgment['case_number']}: {error}")
+    
+    return downloaded_files, errors
+
+async def read_pdf_info_from_page(page, url):
+    """以瀏覽器開啟裁判書頁面，讀取裁判字號、案由與 PDF 連結"""
+    await goto_page(page, full_judgment_url(url), "裁判書頁面")
+    with get_metrics().timer("selector_wait"):
+        await page.wait_for_selector("#jud", timeout=30000)
+    
+    fields = await extract_page_fields(page)
+    case_number = fields.get("case_number") or "unknown_case"
+    case_reason = fields.get("case_reason") or "unknown_reason"
+    pdf_url = fields["pdf_url"]
+    return case_number, case_reason, pdf_url
+
+def store_pdf(url, file_path, file_name):
+    """驗證下載的 PDF 並存入快取，回傳 (檔案路徑, 原始檔名, 錯誤訊息)；不完整的檔案會被刪除"""
+    try:
+        get_judgment_cache().put_pdf(url, file_path, file_name)
+    except ValueError as e:
+        os.remove(file_path)
+        return None, None, str(e)
+    return file_path, file_name, None
+
+async def download_judgment_pdf(context, url, download_folder, client=None, judgment=None):
+    """下載單個裁判書PDF，回傳 (檔案路徑, 原始檔名, 錯誤訊息)
+
+    同時下載的判決可能有相同的裁判字號與案由（或都取不到而使用預設值），
+    因此檔案一律以判決鍵命名，避免互相覆蓋後以錯誤的內容存入快取。
+    """
+    file_path = os.path.join(download_folder, pdf_storage_name(url))
+    cached = get_judgment_cache().get_pdf(url)
+    if cached:
+        cache_path, file_name = cached
+        copy_file(cache_path, file_path, link=True)
+        return file_path, file_name, None
+    
+    page = None
+    client_scope = AsyncExitStack()
+    try:
+        if client is None:
+            client = await client_scope.enter_async_context(session_client(context))
+        # 優先使用查詢時記錄的連結，失敗時才重新讀取裁判書頁面
+        if judgment is not None:
+            stored_path, error = await download_stored_pdf(judgment, download_folder, client)
+            if stored_path:
+                return store_pdf(url, stored_path, judgment["file_name"])
+        
+        pdf_info = None
+        if USE_HTTP_FAST_PATH:
+            details = await fetch_judgment_details_http(client, url)
+            if details and details["pdf_url"]:
+                pdf_info = (details["case_number"], details["case_reason"], details["pdf_url"])
+        
+        if pdf_info is None:
+            page = await context.new_page()
+            pdf_info = await read_pdf_info_from_page(page, url)
+        
+        case_number, case_reason, pdf_url = pdf_info
+        
+        safe_name = pdf_file_name(case_number, case_reason)
+        
+        if not pdf_url:
+            return None, None, "找不到PDF下載連結"
+        
+        error = await stream_to_file(client, pdf_url, file_path)
+        if error:
+            return None, None, error
+        return store_pdf(url, file_path, safe_name)
+            
+    except Exception as e:
+        return None, None, f"下載過程中發生錯誤: {e}"
+    finally:
+        if page:
+            await page.close()
+        await client_scope.aclose()
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# 延遲直方圖的區間上限（秒）
+HISTOGRAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 計算百分位數時保留的最近樣本數
+SAMPLE_WINDOW = 1000
+
+# 設定後每次量測都會以 JSON Lines 附加寫入此檔案
+TRACE_FILE = os.environ.get("FJUD_TRACE_FILE")
+
+# 各階段名稱與說明（依流程順序，用於顯示）
+STAGES = {
+    "browser_launch": "租用瀏覽器",
+    "search_submit": "送出查詢",
+    "frame_discovery": "尋找結果框架",
+    "list_page_load": "清單頁載入",
+    "page_navigation": "查詢頁面開啟",
+    "detail_navigation": "裁判書頁面開啟",
+    "detail_http_fetch": "裁判書頁面 (HTTP)",
+    "selector_wait": "等待頁面元素",
+    "field_extraction": "欄位擷取",
+    "pdf_fetch": "PDF 下載",
+    "disk_write": "寫入磁碟",
+    "zip_build": "寫入壓縮檔",
+    "export_generation": "產生匯出檔",
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class StageStats:
+    """單一階段的次數、錯誤數、累計時間與延遲直方圖"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def add(self, elapsed, error):
+        self.count += 1
+        self.total += elapsed
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+        self.samples.append(elapsed)
+
+
+class Metrics:
+    """行程內各處理階段的延遲量測"""
+
+    def __init__(self, trace_file=TRACE_FILE):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._trace_file = trace_file
+        self._trace = None
+
+    def record(self, stage, elapsed, error=False):
+        """記錄一次量測"""
+        with self._lock:
+            self._stages.setdefault(stage, StageStats()).add(elapsed, error)
+            if self._trace_file:
+                if self._trace is None:
+                    self._trace = open(self._trace_file, "a", encoding="utf-8", buffering=1)
+                self._trace.write(json.dumps(
+                    {"ts": time.time(), "stage": stage, "elapsed": round(elapsed, 6), "error": error}
+                ) + "\n")
+
+    @contextmanager
+    def timer(self, stage):
+        """量測區塊的執行時間，區塊拋出例外時計為錯誤（可用於包住 await）"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - start, error)
+
+    def set_trace_file(self, path):
+        """變更（或以 None 關閉）追蹤檔"""
+        with self._lock:
+            if self._trace:
+                self._trace.close()
+                self._trace = None
+            self._trace_file = path
+
+    def samples(self, stage):
+        """此階段最近的延遲樣本"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            return list(stats.samples) if stats else []
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def snapshot(self):
+        """各階段統計的字典，依流程順序排列"""
+        with self._lock:
+            stages = {stage: (s.count, s.errors, s.total, list(s.buckets), list(s.samples))
+                      for stage, s in self._stages.items()}
+        order = list(STAGES)
+        result = {}
+        for stage in sorted(stages, key=lambda name: order.index(name) if name in order else len(order)):
+            count, errors, total, buckets, samples = stages[stage]
+            result[stage] = {
+                "count": count,
+                "errors": errors,
+                "total_seconds": round(total, 4),
+                "p50": round(percentile(samples, 0.5), 4) if samples else None,
+                "p95": round(percentile(samples, 0.95), 4) if samples else None,
+                "buckets": dict(zip([str(b) for b in HISTOGRAM_BUCKETS], buckets)),
+            }
+        return result
+
+    def to_json(self):
+        """各階段統計與請求排程器的狀態"""
+        from request_scheduler import get_scheduler
+
+        return json.dumps(
+            {"stages": self.snapshot(), "scheduler": get_scheduler().snapshot()}, ensure_ascii=False, indent=2
+        )
+
+    def to_prometheus(self):
+        """以 Prometheus 文字格式輸出（包含請求排程器的計數與各主機的限速狀態）"""
+        from request_scheduler import get_scheduler
+
+        lines = [
+            "# HELP fjud_stage_seconds Latency of pipeline stages.",
+            "# TYPE fjud_stage_seconds histogram",
+        ]
+        snapshot = self.snapshot()
+        for stage, stats in snapshot.items():
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                lines.append(f'fjud_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'fjud_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'fjud_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]}')
+            lines.append(f'fjud_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append("# HELP fjud_stage_errors_total Failed executions of pipeline stages.")
+        lines.append("# TYPE fjud_stage_errors_total counter")
+        for stage, stats in snapshot.items():
+            lines.append(f'fjud_stage_errors_total{{stage="{stage}"}} {stats["errors"]}')
+
+        scheduler = get_scheduler().snapshot()
+        for name, help_text in (("requests", "Requests sent"), ("retries", "Requests retried"), ("failures", "Requests failed after retries")):
+            lines.append(f"# HELP fjud_scheduler_{name}_total {help_text} by the request scheduler.")
+            lines.append(f"# TYPE fjud_scheduler_{name}_total counter")
+            lines.append(f"fjud_scheduler_{name}_total {scheduler[name]}")
+        for name, field, help_text in (
+            ("fjud_host_rate", "rate", "Current token-bucket rate per host (requests per second)."),
+            ("fjud_host_concurrency_limit", "limit", "Current concurrency limit per host."),
+            ("fjud_host_in_flight", "in_flight", "Requests in flight per host."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for host, stats in scheduler["hosts"].items():
+                lines.append(f'{name}{{host="{host}"}} {stats[field]}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """依副檔名寫出 JSON（.json）或 Prometheus 文字格式（其他）"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json() if path.endswith(".json") else self.to_prometheus())
+        return path
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """取得行程共用的量測實例"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
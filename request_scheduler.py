@@ -0,0 +1,272 @@
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+# 重試次數與指數退避（含隨機抖動）的參數
+RETRY_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 每個主機的令牌桶速率（每秒請求數）與同時請求數，依回應狀況以 AIMD 調整
+INITIAL_RATE = 10.0
+MIN_RATE = 0.5
+MAX_RATE = 30.0
+RATE_INCREASE = 0.1
+INITIAL_CONCURRENCY = 8.0
+MIN_CONCURRENCY = 1.0
+MAX_CONCURRENCY = 32.0
+# 同一波失敗只減速一次，避免多個並行請求同時逾時就把速率砍到底
+DECREASE_COOLDOWN = 2.0
+POLL_INTERVAL = 0.05
+
+# 逾時設定為近期延遲 p95 的倍數，樣本不足時使用呼叫端的預設值
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+TIMEOUT_PERCENTILE = 0.95
+TIMEOUT_FACTOR = 3
+MIN_TIMEOUT = 5
+MAX_TIMEOUT = 90
+# 逾時的請求以「逾時秒數 × 此倍數」記為延遲樣本（實際延遲至少這麼長），
+# 避免只從成功請求學習而讓逾時一路縮短
+CENSORED_FACTOR = 2
+# 每次重試把逾時加倍，直到呼叫端的預設值（或 MAX_TIMEOUT）
+RETRY_TIMEOUT_FACTOR = 2
+
+TIMEOUT_ERRORS = {"TimeoutError", "TimeoutException"}
+RETRYABLE_ERRORS = TIMEOUT_ERRORS | {"TransportError", "ConnectionError"}
+
+
+class RetryableStatus(Exception):
+    """伺服器回傳限流或暫時性錯誤的狀態碼"""
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"狀態碼: {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def check_status(status, headers=None):
+    """狀態碼為 429 或 5xx 時拋出 RetryableStatus，交由排程器退避重試"""
+    if status in RETRY_STATUS:
+        retry_after = None
+        if headers and headers.get("retry-after", "").isdigit():
+            retry_after = int(headers["retry-after"])
+        raise RetryableStatus(status, retry_after)
+
+
+def is_retryable(error):
+    """逾時、連線錯誤與限流狀態碼可以重試，其餘錯誤直接交給呼叫端"""
+    if isinstance(error, (RetryableStatus, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # httpx 與 Playwright 只在使用時才匯入，因此以類別名稱判斷
+    if any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__):
+        return True
+    return "net::ERR_" in str(error)
+
+
+def is_timeout(error):
+    """是否為逾時錯誤（asyncio、httpx 或 Playwright）"""
+    return isinstance(error, asyncio.TimeoutError) or any(cls.__name__ in TIMEOUT_ERRORS for cls in type(error).__mro__)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """第 attempt 次重試前的等待秒數（full jitter 指數退避）"""
+    if retry_after:
+        return min(retry_after, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HostLimiter:
+    """單一主機的令牌桶加上 AIMD 同時請求數控制
+
+    狀態以 threading.Lock 保護而非 asyncio 原語，因為 Streamlit 每次重新執行與
+    每個工作階段都有各自的事件迴圈，排程器必須跨迴圈共用。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rate = INITIAL_RATE
+        self.limit = INITIAL_CONCURRENCY
+        self.in_flight = 0
+        self._tokens = INITIAL_RATE
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """等到有令牌且同時請求數未達上限"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.in_flight < int(self.limit):
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = POLL_INTERVAL
+            await asyncio.sleep(max(wait, POLL_INTERVAL))
+
+    def release(self, ok=True, throttled=False):
+        """歸還名額；成功時加性增加，逾時或限流時乘性減少"""
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if ok:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+                self.rate = min(MAX_RATE, self.rate + RATE_INCREASE)
+            elif throttled and now - self._last_decrease > DECREASE_COOLDOWN:
+                self._last_decrease = now
+                self.limit = max(MIN_CONCURRENCY, self.limit / 2)
+                self.rate = max(MIN_RATE, self.rate / 2)
+
+
+class LatencyTracker:
+    """記錄各階段近期的延遲，據以推算逾時"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, stage, elapsed):
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+
+    def record_timeout(self, stage, timeout):
+        """記錄一次逾時：實際延遲未知但至少為逾時秒數，以放大後的值作為樣本"""
+        self.record(stage, timeout * CENSORED_FACTOR)
+
+    def timeout(self, stage, default, attempt=0):
+        """回傳此階段的逾時秒數：近期 p95 延遲的數倍，樣本不足時用預設值
+
+        attempt 為重試次數，每次重試逾時加倍，最多到預設值與 MAX_TIMEOUT 中較大者。
+        """
+        with self._lock:
+            samples = list(self._samples.get(stage, ()))
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return default
+        timeout = max(MIN_TIMEOUT, min(MAX_TIMEOUT, percentile(samples, TIMEOUT_PERCENTILE) * TIMEOUT_FACTOR))
+        if attempt:
+            timeout = min(max(default, timeout), timeout * RETRY_TIMEOUT_FACTOR ** attempt)
+        return timeout
+
+    def summary(self):
+        """各階段的樣本數與 p50/p95 延遲"""
+        with self._lock:
+            items = [(stage, list(samples)) for stage, samples in self._samples.items()]
+        return {
+            stage: {
+                "count": len(samples),
+                "p50": round(percentile(samples, 0.5), 4),
+                "p95": round(percentile(samples, 0.95), 4),
+            }
+            for stage, samples in items if samples
+        }
+
+
+class RequestScheduler:
+    """行程共用的對外請求排程器：依主機限速、失敗時退避重試、逾時隨延遲調整"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.latency = LatencyTracker()
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def limiter(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostLimiter()
+            return self._hosts[host]
+
+    def timeout(self, stage, default, attempt=0):
+        return self.latency.timeout(stage, default, attempt)
+
+    async def run(self, stage, url, attempt, default_timeout, retries=RETRY_ATTEMPTS):
+        """以排程器執行一次請求
+
+        attempt 以本次的逾時秒數呼叫並回傳 awaitable；可重試的錯誤會以指數退避
+        重試，用盡次數或遇到不可重試的錯誤時拋出最後一次的例外。
+        """
+        limiter = self.limiter(url)
+        for n in range(retries + 1):
+            timeout = self.timeout(stage, default_timeout, n)
+            await limiter.acquire()
+            self.stats["requests"] += 1
+            start = time.monotonic()
+            try:
+                result = await attempt(timeout)
+            except asyncio.CancelledError:
+                # 重新執行時中斷的請求也要歸還名額
+                limiter.release(ok=False)
+                raise
+            except Exception as e:
+                if is_timeout(e):
+                    self.latency.record_timeout(stage, timeout)
+                retryable = is_retryable(e)
+                limiter.release(ok=False, throttled=retryable)
+                if not retryable or n == retries:
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                delay = backoff_delay(n, getattr(e, "retry_after", None))
+                print(f"{stage} 請求失敗（{e}），{delay:.1f} 秒後重試 ({n + 1}/{retries})", file=sys.stderr)
+                await asyncio.sleep(delay)
+                continue
+            limiter.release(ok=True)
+            self.latency.record(stage, time.monotonic() - start)
+            return result
+
+    def host_stats(self):
+        """各主機目前的速率與同時請求數上限"""
+        with self._lock:
+            hosts = list(self._hosts.items())
+        return {host: {"rate": round(l.rate, 2), "limit": int(l.limit), "in_flight": l.in_flight} for host, l in hosts}
+
+    def snapshot(self):
+        """請求次數、各主機目前的限速狀態與各階段的延遲摘要（供效能指標顯示與匯出）"""
+        return dict(self.stats, hosts=self.host_stats(), latency=self.latency.summary())
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def share_limits(parts):
+    """把每個主機的速率與同時請求數上限平分給 parts 個行程
+
+    每個行程各有一個排程器，多個工作行程同時查詢時總請求量會乘上行程數；
+    必須在建立排程器之前呼叫（例如工作行程的進入點）。
+    """
+    global INITIAL_RATE, MAX_RATE, INITIAL_CONCURRENCY, MAX_CONCURRENCY
+    if parts <= 1:
+        return
+    INITIAL_RATE = max(MIN_RATE, INITIAL_RATE / parts)
+    MAX_RATE = max(MIN_RATE, MAX_RATE / parts)
+    INITIAL_CONCURRENCY = max(MIN_CONCURRENCY, INITIAL_CONCURRENCY / parts)
+    MAX_CONCURRENCY = max(MIN_CONCURRENCY, MAX_CONCURRENCY / parts)
+
+
+def get_scheduler():
+    """取得行程共用的請求排程器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
@@ -0,0 +1,111 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from judgment_cache import judgment_key
+
+RESULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "fjud_results", "results.sqlite3")
+# 超過此時間未讀取的全文會被清除（工作階段結束後不再需要）
+RESULT_MAX_AGE = 24 * 3600
+# 長時間執行的行程中，寫入全文時每隔多久清除一次過期資料（秒）
+CLEANUP_INTERVAL = 3600
+# 匯出時每次從磁碟讀取的筆數
+TEXT_BATCH_SIZE = 200
+
+
+class ResultStore:
+    """查詢結果全文的磁碟暫存區
+
+    工作階段中的判決資料只保留字號、日期、案由等中繼資料，裁判全文存放在
+    SQLite 中，只有匯出或檢視時才分批讀回，避免多個使用者的結果全部常駐記憶體。
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, max_age=RESULT_MAX_AGE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_age = max_age
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS texts (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.cleanup()
+
+    def put_texts(self, items):
+        """寫入 (網址, 全文) 組合；距離上次清除超過 CLEANUP_INTERVAL 時順便清除過期的全文"""
+        now = time.time()
+        if now - self._last_cleanup > CLEANUP_INTERVAL:
+            self.cleanup()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO texts (key, text, accessed) VALUES (?, ?, ?)",
+                [(judgment_key(url), text, now) for url, text in items]
+            )
+            self._db.commit()
+
+    def get_texts(self, urls):
+        """讀取多筆全文，回傳 {網址: 全文}，不存在的網址不會出現在結果中"""
+        keys = {judgment_key(url): url for url in urls}
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, text FROM texts WHERE key IN ({placeholders})", list(keys)
+            ).fetchall()
+            self._db.execute(
+                f"UPDATE texts SET accessed = ? WHERE key IN ({placeholders})", [time.time(), *keys]
+            )
+            self._db.commit()
+        return {keys[key]: text for key, text in rows}
+
+    def cleanup(self):
+        """刪除太久沒有讀取的全文"""
+        self._last_cleanup = time.time()
+        with self._lock:
+            self._db.execute("DELETE FROM texts WHERE accessed < ?", (time.time() - self.max_age,))
+            self._db.commit()
+
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """取得行程共用的全文暫存區（第一次使用時才建立資料庫）"""
+    global _result_store
+    with _result_store_lock:
+        if _result_store is None:
+            _result_store = ResultStore()
+        return _result_store
+
+
+def compact_judgments(judgments):
+    """把已載入的全文移到磁碟暫存區，判決資料只留下中繼資料（就地修改）"""
+    loaded = [judgment for judgment in judgments if "case_text" in judgment and judgment.get("details_loaded", True)]
+    if loaded:
+        get_result_store().put_texts((judgment["url"], judgment["case_text"]) for judgment in loaded)
+    for judgment in judgments:
+        judgment.pop("case_text", None)
+    return judgments
+
+
+def with_texts(judgments, batch_size=TEXT_BATCH_SIZE, default=""):
+    """依序產生附上全文的判決資料，每次只從磁碟讀取一批"""
+    for start in range(0, len(judgments), batch_size):
+        batch = judgments[start:start + batch_size]
+        texts = get_result_store().get_texts(
+            judgment["url"] for judgment in batch if "case_text" not in judgment
+        )
+        for judgment in batch:
+            if "case_text" in judgment:
+                yield judgment
+            else:
+                yield dict(judgment, case_text=texts.get(judgment["url"], default))
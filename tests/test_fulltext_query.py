@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fulltext_index import FullTextIndex, QuerySyntaxError, to_fts_query  # noqa: E402
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("法院&管轄", '"法院" AND "管轄"'),
+    ("法院+管轄", '"法院" OR "管轄"'),
+    ("法院-管轄", '"法院" NOT "管轄"'),
+    ("法院&-管轄", '"法院" NOT "管轄"'),
+    ("法院 & -管轄", '"法院" NOT "管轄"'),
+    ("(法院+管轄)&公證處", '( "法院" OR "管轄" ) AND "公證 證處"'),
+])
+def test_operators(query, expected):
+    assert to_fts_query(query) == expected
+
+
+@pytest.mark.parametrize("query", ["-管轄", "法院+-管轄", "法院&(-管轄)", "(法院"])
+def test_unsupported_negation_returns_none(query):
+    assert to_fts_query(query) is None
+
+
+def test_search_rejects_unparsable_query(tmp_path):
+    index = FullTextIndex(str(tmp_path / "fulltext.sqlite3"))
+
+    assert index.search("法院&管轄") == []
+    with pytest.raises(QuerySyntaxError):
+        index.search("法院+-管轄")
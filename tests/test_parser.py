@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import judgment_core  # noqa: E402
+from judgment_core import element_text, make_soup, parse_judgment_html  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_full_detail_page():
+    details = parse_judgment_html(load_fixture("detail_full.html"))
+
+    assert details["case_number"] == "臺灣臺北地方法院 112 年度訴字第 1234 號民事判決"
+    assert details["case_date"] == "民國 112 年 05 月 10 日"
+    assert details["case_reason"] == "損害賠償"
+    assert details["case_text"] == (
+        "臺灣臺北地方法院民事判決\n"
+        "原   告　甲公司\n"
+        "主　　文\n"
+        "被告應給付原告新臺幣壹萬元。\n"
+        "訴訟費用由被告負擔。\n"
+        "事實及理由"
+    )
+
+
+def test_relative_pdf_link_uses_site_root():
+    details = parse_judgment_html(load_fixture("detail_full.html"))
+
+    assert details["pdf_url"] == (
+        judgment_core.SITE_ROOT
+        + "/EXPORTFILE/reformat.aspx?type=JD&id=TPDV%2c112%2c%e8%a8%b4%2c1234%2c20230510%2c1&lawpara=&ispdf=1"
+    )
+
+
+def test_absolute_pdf_link_is_kept():
+    details = parse_judgment_html(load_fixture("detail_absolute_pdf.html"))
+
+    assert details["case_number"] == "最高法院 111 年度台上字第 99 號刑事判決"
+    assert details["case_text"] == "上訴駁回。"
+    assert details["pdf_url"] == "https://data.judicial.gov.tw/opendl/JDocFile/TPSM/111%2c%e5%8f%b0%e4%b8%8a%2c99.pdf"
+
+
+def test_missing_content_and_pdf_link():
+    details = parse_judgment_html(load_fixture("detail_no_content.html"))
+
+    assert details["case_number"] == "臺灣高等法院 110 年度上字第 5 號民事裁定"
+    assert details["case_date"] == "民國 110 年 03 月 02 日"
+    assert details["case_reason"] == "未找到案由"
+    assert details["case_text"] == "未找到裁判全文"
+    assert details["pdf_url"] is None
+
+
+@pytest.mark.parametrize("fixture", ["captcha_page.html", "error_page.html"])
+def test_pages_without_case_number_fall_back_to_browser(fixture):
+    assert parse_judgment_html(load_fixture(fixture)) is None
+
+
+def test_element_text_collapses_blank_lines():
+    soup = make_soup("<div class='htmlcontent'><div>甲</div><div></div><p>乙 \t<br><br>丙</p></div>")
+
+    assert element_text(soup.select_one(".htmlcontent")) == "甲\n乙\n丙"
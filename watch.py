@@ -0,0 +1,104 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+
+from judgment_cache import judgment_key
+
+WATCH_FOLDER = os.environ.get("FJUD_WATCH_DIR", "./watch")
+
+# 詳細資訊讀取失敗的判決不記為已看過，下次同步時重試
+FAILED_CASE_NUMBER = "獲取失敗"
+
+
+def watch_id(keyword):
+    """由查詢關鍵字計算狀態檔名稱"""
+    return hashlib.sha256(keyword.encode("utf-8")).hexdigest()[:24]
+
+
+class WatchState:
+    """單一查詢的同步狀態
+
+    記錄已看過的判決鍵（高水位）、最新一筆的裁判日期與上次同步時間，存放在
+    WATCH_FOLDER 下以關鍵字雜湊命名的 JSON 檔中，寫入時先寫暫存檔再取代。
+    """
+
+    def __init__(self, keyword, folder=WATCH_FOLDER):
+        self.keyword = keyword
+        self.path = os.path.join(folder, f"{watch_id(keyword)}.json")
+        self.seen = set()
+        self.latest_date = None
+        self.last_run = None
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.seen = set(data.get("seen", []))
+            self.latest_date = data.get("latest_date")
+            self.last_run = data.get("last_run")
+
+    @property
+    def is_new(self):
+        """是否為第一次同步（沒有任何已看過的判決）"""
+        return not self.seen
+
+    def is_seen(self, url):
+        return judgment_key(url) in self.seen
+
+    def reached(self, links):
+        """清單頁中出現已看過的判決時回傳 True（結果依裁判日期由新到舊，後面的頁面都已看過）"""
+        return any(self.is_seen(link["url"]) for link in links)
+
+    def mark(self, judgments):
+        """把成功讀取的判決記為已看過，回傳記錄的筆數"""
+        marked = 0
+        for judgment in judgments:
+            if judgment.get("case_number") == FAILED_CASE_NUMBER:
+                continue
+            # 清單依裁判日期由新到舊，本次第一筆即為最新的判決
+            if not marked and judgment.get("case_date"):
+                self.latest_date = judgment["case_date"]
+            self.seen.add(judgment_key(judgment["url"]))
+            marked += 1
+        return marked
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.last_run = time.time()
+        temp_path = self.path + ".part"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "keyword": self.keyword,
+                "last_run": self.last_run,
+                "latest_date": self.latest_date,
+                "seen": sorted(self.seen),
+            }, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def describe(self):
+        if self.is_new:
+            return "第一次同步，將讀取全部結果"
+        last_run = datetime.datetime.fromtimestamp(self.last_run).strftime("%Y-%m-%d %H:%M") if self.last_run else "未知"
+        return f"上次同步 {last_run}，已記錄 {len(self.seen)} 筆（最新裁判日期 {self.latest_date or '未知'}）"
+
+
+async def sync_query(context, keyword, state, max_pages, concurrency, full=False, on_status=None):
+    """只取得上次同步後新出現的判決（含詳細資訊），回傳新判決清單
+
+    清單頁逐頁讀取，遇到已看過的判決即停止換頁；full 為 True 時仍讀取全部頁面，
+    用來補回排序在已看過判決之後才公告的判決。只有新判決會讀取詳細資訊。
+    查詢失敗時拋出例外，呼叫端不應更新同步狀態。
+    """
+    from judgment_core import ensure_details, fetch_judgments, print_status
+
+    on_status = on_status or print_status
+    on_status(state.describe())
+    stop = None if full or state.is_new else state.reached
+    judgments, _ = await fetch_judgments(
+        context, keyword, max_pages, concurrency, lazy=True, on_status=on_status, stop=stop, raise_errors=True
+    )
+    new_judgments = [judgment for judgment in judgments if not state.is_seen(judgment["url"])]
+    on_status(f"清單共 {len(judgments)} 筆，其中新判決 {len(new_judgments)} 筆")
+    if new_judgments:
+        await ensure_details(context, new_judgments, concurrency)
+    return new_judgments